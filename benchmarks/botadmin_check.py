@@ -0,0 +1,105 @@
+"""Measures the cost of BotAdmin's global command check as its lists grow.
+
+"lists" is the check the way it used to be, scanning the JSON arrays in
+botadmin.json on every call, "snapshot" is the current per-server snapshot.
+Permissions are stubbed so only the bookkeeping is measured.
+
+    python benchmarks/botadmin_check.py --sizes 100 10000 100000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from types import SimpleNamespace
+
+from discordbot.bot_utils import checks, config
+from discordbot.cogs.botadmin import BotAdmin
+
+SERVER = '100000000000000000'
+
+
+class StubBot:
+    def __init__(self, loop, folder):
+        self.loop = loop
+        self.folder = folder
+
+    def open_config(self, name, **options):
+        options.pop('backend', None)
+        return config.Config(name, directory=self.folder, loop=self.loop)
+
+    def add_message_stage(self, stage, priority=100):
+        pass
+
+
+def legacy_check(cog, ctx):
+    msg = ctx.message
+
+    if checks.is_owner_check(msg):
+        return True
+
+    if msg.server:
+        db = cog.config.get('plonks', {}).get(msg.server.id, [])
+        if not msg.author.server_permissions.manage_server and msg.author.id in db:
+            return False
+
+    perms = msg.channel.permissions_for(msg.author)
+    if not perms.administrator and msg.channel.id in cog.config.get('ignored', []):
+        return False
+
+    if checks.is_owner_check(msg):
+        return True
+
+    try:
+        entry = cog.config.get('commands', {})[msg.server.id]
+    except (KeyError, AttributeError):
+        return True
+    else:
+        return ctx.command.qualified_name.split(' ')[0] not in entry
+
+
+def build_context(user_id, channel_id, command):
+    permissions = SimpleNamespace(administrator=False, manage_server=False)
+    author = SimpleNamespace(id=user_id, server_permissions=permissions)
+    channel = SimpleNamespace(id=channel_id, permissions_for=lambda member: permissions)
+    message = SimpleNamespace(author=author, channel=channel, server=SimpleNamespace(id=SERVER))
+    return SimpleNamespace(message=message, command=SimpleNamespace(qualified_name=command))
+
+
+def timed(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def run(loop, size, calls):
+    with tempfile.TemporaryDirectory() as folder:
+        cog = BotAdmin(StubBot(loop, folder + '/'))
+        # everything is on the lists except for the caller, the worst case for a scan
+        loop.run_until_complete(cog.config.put('ignored', [str(i) for i in range(size)]))
+        loop.run_until_complete(cog.config.put('plonks', {SERVER: [str(i) for i in range(size)]}))
+        loop.run_until_complete(cog.config.put('commands', {SERVER: ['command%s' % i for i in range(size)]}))
+        loop.run_until_complete(cog.config.flush())
+
+        ctx = build_context('user', 'channel', 'ping')
+        snapshot_check = cog._BotAdmin__check
+        assert legacy_check(cog, ctx) and snapshot_check(ctx)
+
+        print('{:>8} entries   lists {:>10.2f} us/check   snapshot {:>6.2f} us/check'.format(
+            size, timed(lambda: legacy_check(cog, ctx), calls), timed(lambda: snapshot_check(ctx), calls)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for size in args.sizes:
+        run(loop, size, args.calls)
+
+
+if __name__ == '__main__':
+    main()
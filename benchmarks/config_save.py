@@ -0,0 +1,65 @@
+"""Measures how long Config takes to save as the document grows.
+
+"full" re-encodes the whole document the way saves used to, "one key" is the
+common case of a single changed top-level key with everything else cached.
+
+    python benchmarks/config_save.py --sizes 1000 10000 50000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from discordbot.bot_utils import config
+
+
+def build_document(size):
+    # shaped like reactions.json: guild id -> trigger -> reaction data
+    return {str(100000000000000000 + i): {'trigger %s' % n: {'response': 'hello there ' * 4, 'reaction': ['\U0001f44d']}
+                                          for n in range(5)}
+            for i in range(size)}
+
+
+def legacy_dump(cfg):
+    temp = '%s-%s.tmp' % (cfg.folder + cfg.name, uuid.uuid4())
+    with open(temp, 'w', encoding='utf-8') as tmp:
+        json.dump(cfg._db.copy(), tmp, ensure_ascii=True, cls=cfg.encoder, separators=(',', ':'))
+    os.replace(temp, cfg.folder + cfg.name)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    print('{:>8} {:>10} {:>12} {:>12} {:>12}'.format('keys', 'size', 'before (ms)', 'full (ms)', 'one key (ms)'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            cfg = config.Config('bench-%s.json' % size, directory=folder, loop=loop)
+            cfg._db = build_document(size)
+            key = next(iter(cfg._db))
+
+            before = timed(lambda: legacy_dump(cfg), args.repeat)
+            full = timed(lambda: cfg._dump(), args.repeat)
+            cfg._dump()
+            one = timed(lambda: cfg._dump({key}), args.repeat)
+            file_size = os.path.getsize(cfg.folder + cfg.name)
+            print('{:>8} {:>9.1f}K {:>12.2f} {:>12.2f} {:>12.2f}'.format(size, file_size / 1024, before, full, one))
+
+
+if __name__ == '__main__':
+    main()
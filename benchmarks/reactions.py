@@ -0,0 +1,153 @@
+"""Measures how Reactions._check_for_reactions scales with the number of triggers.
+
+Builds synthetic trigger sets and a corpus of chat-like messages, then feeds
+every message through the cog with a stub bot that records outgoing
+send_message/add_reaction calls instead of talking to Discord.
+
+    python benchmarks/reactions.py --triggers 10 1000 50000 --matcher both
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from discordbot.bot_utils import config
+from discordbot.bot_utils.matcher import TriggerMatcher
+from discordbot.cogs import reactions
+from discordbot.cogs.reactions import Reactions
+
+WORDS = ('the a i you it lol lmao ok yes no what why how when where good bad nice cool game play win lose '
+         'server bot discord hello hi hey thanks please sorry love hate food pizza cat dog meme music song '
+         'stream today tomorrow night morning work school friend team match rank gg wp brb afk idk tbh').split()
+
+
+class NaiveMatcher:
+    """The matching loop Reactions used before TriggerMatcher, kept for comparison."""
+
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+
+    def match(self, content):
+        activated = []
+        msg = content.lower()
+        for r in self.triggers:
+            location = msg.find(r.lower())
+            if location >= 0:
+                if location + len(r) >= len(msg):
+                    activated.append(r)
+                elif msg[location + len(r)] in [' ', '.', '!', '?', ',', "'"]:
+                    activated.append(r)
+        return activated
+
+
+class StubBot:
+    def __init__(self, loop, folder):
+        self.loop = loop
+        self.folder = folder
+        self.sent = 0
+        self.reacted = 0
+
+    def open_config(self, name, **options):
+        options.pop('backend', None)
+        return config.Config(name, directory=self.folder, loop=self.loop)
+
+    async def send_message(self, destination, content=None, **kwargs):
+        self.sent += 1
+
+    async def add_reaction(self, message, emoji):
+        self.reacted += 1
+
+    def add_message_stage(self, stage, priority=100):
+        pass
+
+
+def build_triggers(count, rng):
+    triggers = {}
+    while len(triggers) < count:
+        phrase = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        phrase += ' %s' % rng.randint(0, count)
+        triggers[phrase] = {'response': 'response to ' + phrase, 'reaction': ['\U0001f44d', '\U0001f602']}
+    return triggers
+
+
+def build_corpus(count, triggers, rng, hit_rate):
+    phrases = list(triggers)
+    corpus = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 25))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(phrases))
+        corpus.append(' '.join(words) + rng.choice(('', '.', '!', '?')))
+    return corpus
+
+
+async def drive(cog, messages):
+    latencies = []
+    for message in messages:
+        start = time.perf_counter()
+        await cog._check_for_reactions(message, message.content.lower())
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(loop, folder, matcher, corpus, triggers):
+    bot = StubBot(loop, folder)
+    cog = Reactions(bot)
+    cog._stats_task.cancel()
+    cog.config._db['1'] = triggers
+    reactions.TriggerMatcher = NaiveMatcher if matcher == 'naive' else TriggerMatcher
+    cog.get_matcher('1', triggers)  # build outside the timed loop, like a warm cache
+
+    channel = SimpleNamespace(id='2')
+    server = SimpleNamespace(id='1')
+    messages = [SimpleNamespace(content=content, server=server, channel=channel) for content in corpus]
+
+    total = time.perf_counter()
+    latencies = loop.run_until_complete(drive(cog, messages))
+    total = time.perf_counter() - total
+
+    tracemalloc.start()
+    loop.run_until_complete(drive(cog, messages[:200]))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'rate': len(messages) / total,
+        'p50': statistics.median(latencies) * 1e6,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        'peak': peak / 1024,
+        'calls': bot.sent + bot.reacted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--triggers', type=int, nargs='+', default=[10, 100, 1000, 10000, 50000])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--hit-rate', type=float, default=0.1, help='share of messages containing a trigger')
+    parser.add_argument('--matcher', choices=('automaton', 'naive', 'both'), default='both')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    matchers = ('automaton', 'naive') if args.matcher == 'both' else (args.matcher,)
+    loop = asyncio.get_event_loop()
+    print('{:>9} {:>10} {:>12} {:>10} {:>10} {:>12} {:>8}'.format(
+        'triggers', 'matcher', 'msgs/sec', 'p50 (us)', 'p99 (us)', 'peak (KiB)', 'calls'))
+    with tempfile.TemporaryDirectory() as folder:
+        for count in args.triggers:
+            rng = random.Random(args.seed)
+            triggers = build_triggers(count, rng)
+            corpus = build_corpus(args.messages, triggers, rng, args.hit_rate)
+            for matcher in matchers:
+                result = run(loop, folder, matcher, corpus, triggers)
+                print('{:>9} {:>10} {rate:>12.0f} {p50:>10.1f} {p99:>10.1f} {peak:>12.1f} {calls:>8}'.format(
+                    count, matcher, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,7 @@ __version__ = '0.2.3.a2'
 
 
 from .discordbot import DiscordBot
+from .pipeline import MessageContext
 from .colors import Colors
 from .utilities import *
 from .bot_utils.config import Config
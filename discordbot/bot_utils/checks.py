@@ -3,17 +3,135 @@ from discord.ext import commands
 
 from discordbot.bot_utils import config
 
-settings = config.Config('settings.json', directory="")
-meta = settings.get('meta', {})
-owners = meta.get('owner', "249746236008169473")
+# the same live instance the bot uses, so owner changes show up here too
+settings = config.open_config('settings.json', directory="")
 
 
+def owner_id():
+    return settings.get('meta', {}).get('owner', "249746236008169473")
+
 def is_owner_check(message):
-    return message.author.id == owners
+    return message.author.id == owner_id()
 
 def is_owner():
     return commands.check(lambda ctx: is_owner_check(ctx.message))
 
+
+class _ServerCache:
+    __slots__ = ('permissions', 'member_roles', 'role_names')
+
+    def __init__(self):
+        # member id: {channel id: Permissions}
+        self.permissions = {}
+        # member id: frozenset of role ids
+        self.member_roles = {}
+        # role name: set of role ids, built on first use
+        self.role_names = None
+
+
+class PermissionCache:
+    """Caches resolved channel permissions and role lookups per server.
+
+    Everything cached for a server is dropped when its roles, channels or
+    owner change, and a member's entries are dropped when their roles change.
+    :meth:`install` hooks the invalidation up to a bot's events.
+    """
+
+    max_members = 5000
+
+    def __init__(self):
+        self._servers = {}
+
+    def _server(self, server):
+        try:
+            return self._servers[server.id]
+        except KeyError:
+            cache = self._servers[server.id] = _ServerCache()
+            return cache
+
+    def permissions_for(self, channel, member):
+        """Cached version of ``channel.permissions_for(member)``."""
+        if channel.is_private:
+            return channel.permissions_for(member)
+
+        cache = self._server(channel.server).permissions
+        try:
+            return cache[member.id][channel.id]
+        except KeyError:
+            if member.id not in cache and len(cache) >= self.max_members:
+                cache.clear()
+            resolved = cache.setdefault(member.id, {})[channel.id] = channel.permissions_for(member)
+            return resolved
+
+    def has_role(self, member, names):
+        """Checks if a member has a role with any of the given names."""
+        cache = self._server(member.server)
+        if cache.role_names is None:
+            cache.role_names = {}
+            for role in member.server.roles:
+                cache.role_names.setdefault(role.name, set()).add(role.id)
+
+        try:
+            roles = cache.member_roles[member.id]
+        except KeyError:
+            if len(cache.member_roles) >= self.max_members:
+                cache.member_roles.clear()
+            roles = cache.member_roles[member.id] = frozenset(role.id for role in member.roles)
+
+        return any(not roles.isdisjoint(cache.role_names.get(name, ())) for name in names)
+
+    def invalidate(self, server, member=None):
+        """Drops the cached entries of a server, or only those of one of its members."""
+        if member is None:
+            self._servers.pop(server.id, None)
+            return
+
+        cache = self._servers.get(server.id)
+        if cache is not None:
+            cache.permissions.pop(member.id, None)
+            cache.member_roles.pop(member.id, None)
+
+    def install(self, bot):
+        """Registers the listeners that keep the cache up to date."""
+        for name in ('on_server_role_create', 'on_server_role_delete', 'on_server_role_update', 'on_member_update',
+                     'on_member_remove', 'on_channel_update', 'on_channel_delete', 'on_server_update',
+                     'on_server_remove'):
+            bot.add_listener(getattr(self, name), name)
+
+    async def on_server_role_create(self, role):
+        self.invalidate(role.server)
+
+    async def on_server_role_delete(self, role):
+        self.invalidate(role.server)
+
+    async def on_server_role_update(self, before, after):
+        self.invalidate(after.server)
+
+    async def on_member_update(self, before, after):
+        # presence changes come through here as well, those don't affect permissions
+        if before.roles != after.roles:
+            self.invalidate(after.server, after)
+
+    async def on_member_remove(self, member):
+        self.invalidate(member.server, member)
+
+    async def on_channel_update(self, before, after):
+        if not after.is_private:
+            self.invalidate(after.server)
+
+    async def on_channel_delete(self, channel):
+        if not channel.is_private:
+            self.invalidate(channel.server)
+
+    async def on_server_update(self, before, after):
+        self.invalidate(after)
+
+    async def on_server_remove(self, server):
+        self.invalidate(server)
+
+
+permissions = PermissionCache()
+
 # The permission system of the bot is based on a "just works" basis
 # You have permissions and the bot has permissions. If you meet the permissions
 # required to execute the command (and the bot does as well) then it goes through
@@ -29,9 +147,7 @@ def check_permissions(ctx, perms):
     if is_owner_check(msg):
         return True
 
-    ch = msg.channel
-    author = msg.author
-    resolved = ch.permissions_for(author)
+    resolved = permissions.permissions_for(msg.channel, msg.author)
     return all(getattr(resolved, name, None) == value for name, value in perms.items())
 
 def role_or_permissions(ctx, check, **perms):
@@ -46,15 +162,25 @@ def role_or_permissions(ctx, check, **perms):
     role = discord.utils.find(check, author.roles)
     return role is not None
 
+def role_names_or_permissions(ctx, names, **perms):
+    if check_permissions(ctx, perms):
+        return True
+
+    ch = ctx.message.channel
+    if ch.is_private:
+        return False # can't have roles in PMs
+
+    return permissions.has_role(ctx.message.author, names)
+
 def mod_or_permissions(**perms):
     def predicate(ctx):
-        return role_or_permissions(ctx, lambda r: r.name in ('Bot Mod', 'Bot Admin'), **perms)
+        return role_names_or_permissions(ctx, ('Bot Mod', 'Bot Admin'), **perms)
 
     return commands.check(predicate)
 
 def admin_or_permissions(**perms):
     def predicate(ctx):
-        return role_or_permissions(ctx, lambda r: r.name == 'Bot Admin', **perms)
+        return role_names_or_permissions(ctx, ('Bot Admin',), **perms)
 
     return commands.check(predicate)
 
@@ -1,10 +1,58 @@
 import json
+import mmap
 import os
+import struct
+import sys
+import time
+import traceback
 import uuid
 import asyncio
+import sqlite3
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# every live Config, so pending writes can be flushed on shutdown
+_instances = weakref.WeakSet()
+
+# Configs created with load_later that have not finished loading yet
+_pending = weakref.WeakSet()
+
+# (directory, name) -> the shared Config handed out by open_config
+_registry = {}
+
 
 class Config:
-    """The "database" object. Internally based on ``json``."""
+    """The "database" object. Internally based on ``json``.
+
+    Saves caused by :meth:`put` or :meth:`remove` only re-encode the
+    top-level keys that were changed through them; the encoded JSON of every
+    other key is cached. Values that are mutated in place must be ``put``
+    back, or written out by calling :meth:`save`, which re-encodes everything.
+
+    By default every :meth:`put` and :meth:`remove` rewrites the file. Passing
+    ``write_delay`` enables write-behind mode instead: mutations only mark the
+    config as dirty and a single save is scheduled ``write_delay`` seconds
+    later, or immediately once ``write_threshold`` changes have piled up.
+    Call :meth:`flush` to force pending changes to disk.
+
+    With ``load_later`` the file is read in the background instead of in the
+    constructor. Until then the config looks empty, so readers that can run
+    early should ``await`` :meth:`wait_until_ready` first.
+
+    Lookups that would otherwise scan stored lists can use derived indexes
+    declared with :meth:`add_index`; the file itself stays plain JSON.
+
+    ``generation`` goes up every time data is (re)loaded from disk, so caches
+    built from the data can tell when they are stale.
+    """
 
     def __init__(self, name, **options):
         self.name = name
@@ -14,50 +62,264 @@ class Config:
         self.encoder = options.pop('encoder', None)
         self.loop = options.pop('loop', asyncio.get_event_loop())
         self.lock = asyncio.Lock()
+        self.executor = options.pop('executor', None)
+        self.write_delay = options.pop('write_delay', None)
+        self.write_threshold = options.pop('write_threshold', None)
+        self._pending = 0
+        self._flush_handle = None
+        self._dirty = set()
+        self._fragments = {}
+        self._index_defs = {}
+        self._indexes = {}
+        self._load_task = None
+        # key: value (or _REMOVED) of every change made while a load is reading the files
+        self._loading = None
+        self.ready = asyncio.Event()
+        self.load_time = None
+        self.generation = 0
+        self._seen = None
         if self.folder:
             self.folder += "/"
             os.makedirs(self.folder, exist_ok=True)
         if options.pop('load_later', False):
-            self.loop.create_task(self.load())
+            self._clear()
+            _pending.add(self)
+            # nobody may ever ask for it explicitly, so load once the loop runs
+            self.loop.call_soon(self._start_load)
         else:
-            self.load_from_file()
+            self._timed_load()
+            self.ready.set()
+        _instances.add(self)
+
+    def _clear(self):
+        # what readers see until the file has been loaded
+        self._db = {}
 
     def load_from_file(self):
+        self._fragments = {}
+        self._import_journal()
         try:
             with open(self.folder+self.name, 'r') as f:
                 self._db = json.load(f, object_hook=self.object_hook)
         except FileNotFoundError:
             self._db = {}
 
+    def _import_journal(self):
+        # a JournalConfig may have left changes behind in its journal, which this file would miss
+        if os.path.exists(self.folder + self.name + '.journal'):
+            fold_journal(self.folder + self.name)
+
+    def _timed_load(self):
+        start = time.perf_counter()
+        self.load_from_file()
+        self.load_time = time.perf_counter() - start
+        self._seen = self._stat()
+        self._indexes = {}
+        self.generation += 1
+
     async def load(self):
         with await self.lock:
-            await self.loop.run_in_executor(None, self.load_from_file)
+            await self._reload()
+        _pending.discard(self)
+        self.ready.set()
+
+    async def _reload(self):
+        # must hold the lock. Changes made while the files are read would be lost
+        # when the new data is swapped in, so they are applied again on top of it
+        self._loading = {}
+        try:
+            await self.loop.run_in_executor(self.executor, self._timed_load)
+        finally:
+            changes, self._loading = self._loading, None
+        for key, value in changes.items():
+            self._apply(key, value)
+
+    def _apply(self, key, value):
+        if value is _REMOVED:
+            self._db.pop(key, None)
+        else:
+            self._db[key] = value
+        self._fragments.pop(key, None)
+        self._invalidate(key)
+
+    def _record(self, key, value):
+        if self._loading is not None:
+            self._loading[key] = value
+
+    def _start_load(self):
+        if self._load_task is None and not self.ready.is_set():
+            self._load_task = self.loop.create_task(self.load())
+        return self._load_task
+
+    def _watched_paths(self):
+        return [self.folder + self.name]
+
+    def _stat(self):
+        # a cheap fingerprint of the files backing this config
+        fingerprint = []
+        for path in self._watched_paths():
+            try:
+                result = os.stat(path)
+            except FileNotFoundError:
+                fingerprint.append(None)
+            else:
+                fingerprint.append((result.st_mtime_ns, result.st_size))
+        return fingerprint
+
+    async def reload_if_changed(self):
+        """Reloads the data if something else changed the file on disk.
+
+        Returns whether a reload happened. Nothing is reloaded while there are
+        unsaved local changes, those win the next time the config is saved.
+        """
+        if not self.ready.is_set() or self.dirty or self._dirty:
+            return False
+        if self._stat() == self._seen:
+            return False
+
+        with await self.lock:
+            # a save may have finished or local changes come in while we waited
+            if self._pending or self._dirty or self._stat() == self._seen:
+                return False
+            await self._reload()
+        return True
+
+    async def wait_until_ready(self):
+        """Waits until the data has been loaded, starting the load if needed."""
+        if not self.ready.is_set():
+            self._start_load()
+            await self.ready.wait()
+
+    def _fragment(self, key):
+        # the encoded "key":value pair of a single entry
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            entry = {key: self._db[key]}
+            fragment = json.dumps(entry, ensure_ascii=True, cls=self.encoder, separators=(',', ':'))[1:-1]
+            self._fragments[key] = fragment
+        return fragment
+
+    def _dump(self, dirty=None):
+        if dirty is None:
+            self._fragments.clear()
+        else:
+            for key in dirty:
+                self._fragments.pop(key, None)
 
-    def _dump(self):
         temp = '%s-%s.tmp' % (self.folder+self.name, uuid.uuid4())
         with open(temp, 'w', encoding='utf-8') as tmp:
-            json.dump(self._db.copy(), tmp, ensure_ascii=True, cls=self.encoder, separators=(',', ':'))
+            separator = '{'
+            for key in list(self._db):
+                try:
+                    fragment = self._fragment(key)
+                except KeyError:
+                    # removed while we were writing, the next save drops it
+                    continue
+                tmp.write(separator)
+                tmp.write(fragment)
+                separator = ','
+            tmp.write('}' if separator == ',' else '{}')
 
         # automatically move the file
         os.replace(temp, self.folder+self.name)
 
     async def save(self):
+        """Writes every entry to disk, including values changed in place."""
+        await self._save(everything=True)
+
+    async def _save(self, everything=False):
         with await self.lock:
-            await self.loop.run_in_executor(None, self._dump)
+            dirty, self._dirty = self._dirty, set()
+            await self.loop.run_in_executor(self.executor, self._dump, None if everything else dirty)
+            self._seen = self._stat()
+
+    @property
+    def dirty(self):
+        """Whether there are changes that have not been written yet."""
+        return self._pending > 0
+
+    async def flush(self):
+        """Writes pending changes to disk, if there are any."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if self._pending:
+            self._pending = 0
+            await self._save()
+
+    def _scheduled_flush(self):
+        self._flush_handle = None
+        self.loop.create_task(self.flush())
+
+    async def _changed(self):
+        if self.write_delay is None:
+            await self._save()
+            return
+
+        self._pending += 1
+        if self.write_threshold and self._pending >= self.write_threshold:
+            await self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.write_delay, self._scheduled_flush)
+
+    def add_index(self, name, key, builder, default=None, per_key=False):
+        """Declares a derived index over the value stored under ``key``.
+
+        ``builder`` turns the stored value, or ``default`` when there is none,
+        into the index, e.g. ``frozenset`` for a list of ids. It is rebuilt
+        lazily after that key is put, removed or reloaded.
+
+        With ``per_key`` the stored value is a dict and the index is a
+        :class:`KeyedIndex` applying ``builder`` to each of its entries on their
+        own. Passing ``changed`` to :meth:`put` then only rebuilds those entries.
+        """
+        self._index_defs[name] = (key, builder, default, per_key)
+        self._indexes.pop(name, None)
+
+    def index(self, name):
+        """Retrieves a derived index declared with :meth:`add_index`."""
+        try:
+            return self._indexes[name]
+        except KeyError:
+            key, builder, default, per_key = self._index_defs[name]
+            source = self.get(key, default)
+            value = self._indexes[name] = KeyedIndex(source, builder) if per_key else builder(source)
+            return value
+
+    def _invalidate(self, key, changed=None):
+        for name, (index_key, _, default, per_key) in self._index_defs.items():
+            if index_key != key:
+                continue
+            index = self._indexes.get(name)
+            if per_key and changed is not None and index is not None:
+                index.update(self.get(key, default), changed)
+            else:
+                self._indexes.pop(name, None)
 
     def get(self, key, *args):
         """Retrieves a data entry."""
         return self._db.get(key, *args)
 
-    async def put(self, key, value, *args):
-        """Edits a data entry."""
+    async def put(self, key, value, *args, changed=None):
+        """Edits a data entry.
+
+        ``changed`` optionally names the entries of a dict value that were
+        changed, so indexes declared with ``per_key`` only rebuild those.
+        """
         self._db[key] = value
-        await self.save()
+        self._record(key, value)
+        self._dirty.add(key)
+        self._invalidate(key, changed)
+        await self._changed()
 
     async def remove(self, key):
         """Removes a data entry."""
         del self._db[key]
-        await self.save()
+        self._record(key, _REMOVED)
+        self._dirty.add(key)
+        self._invalidate(key)
+        await self._changed()
 
     def __contains__(self, item):
         return item in self._db
@@ -70,3 +332,844 @@ class Config:
 
     def all(self):
         return self._db
+
+
+class KeyedIndex:
+    """An index over a dict, built separately for each of its entries when first looked up."""
+
+    __slots__ = ('_source', '_builder', '_built')
+
+    def __init__(self, source, builder):
+        self._source = source
+        self._builder = builder
+        self._built = {}
+
+    def get(self, key, default=None):
+        try:
+            return self._built[key]
+        except KeyError:
+            if key not in self._source:
+                return default
+            value = self._built[key] = self._builder(self._source[key])
+            return value
+
+    def __contains__(self, key):
+        return key in self._source
+
+    def update(self, source, changed):
+        """Points the index at the new value, dropping the entries in ``changed``."""
+        self._source = source
+        for key in changed:
+            self._built.pop(key, None)
+
+
+class JournalConfig(Config):
+    """A Config that appends per-key change records instead of rewriting the file.
+
+    Every save appends one ``put`` or ``remove`` record per changed top-level
+    key to ``<name>.journal``, which is replayed over the snapshot on load.
+    Once the journal grows past ``compact_threshold`` bytes it is folded back
+    into the snapshot in the background.
+    """
+
+    def __init__(self, name, **options):
+        self.compact_threshold = options.pop('compact_threshold', 1024 * 1024)
+        self._compacting = False
+        self._journal_size = 0
+        super().__init__(name, **options)
+
+    @property
+    def journal(self):
+        return self.folder + self.name + '.journal'
+
+    def _watched_paths(self):
+        return [self.folder + self.name, self.journal]
+
+    def _import_journal(self):
+        # the journal is ours, it is replayed below
+        pass
+
+    def load_from_file(self):
+        super().load_from_file()
+        self._journal_size = _replay_journal(self._db, self.journal, self.object_hook)
+
+    def _dump(self, dirty=None):
+        if dirty is None:
+            return self._compact(None)
+
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            for key in dirty:
+                self._fragments.pop(key, None)
+                if key in self._db:
+                    record = ['put', key, self._db[key]]
+                else:
+                    record = ['remove', key]
+                f.write(json.dumps(record, ensure_ascii=True, cls=self.encoder, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_size = f.tell()
+
+    def _compact(self, dirty=frozenset()):
+        # the snapshot is swapped in atomically before the journal is emptied,
+        # so a crash in between only means replaying records that are already applied
+        super()._dump(dirty)
+        temp = '%s-%s.tmp' % (self.journal, uuid.uuid4())
+        open(temp, 'w').close()
+        os.replace(temp, self.journal)
+        self._journal_size = 0
+
+    async def compact(self):
+        """Folds the journal back into the snapshot file."""
+        try:
+            with await self.lock:
+                await self.loop.run_in_executor(self.executor, self._compact)
+                self._seen = self._stat()
+        finally:
+            self._compacting = False
+
+    async def _save(self, everything=False):
+        await super()._save(everything)
+        if not self._compacting and self._journal_size > self.compact_threshold:
+            self._compacting = True
+            self.loop.create_task(self.compact())
+
+
+class SharedConfig(Config):
+    """A JSON Config that several processes can write to at the same time.
+
+    Each write takes an exclusive advisory lock on ``<name>.lock`` and bumps
+    the version stamp of every top-level key it changes in ``<name>.versions``.
+    Keys another process changed since we last looked are merged in first, so
+    writers only clobber each other when they touch the same top-level key.
+    Only the keys whose stamps moved are replaced in memory.
+    """
+
+    def __init__(self, name, **options):
+        if fcntl is None:
+            raise RuntimeError('SharedConfig needs fcntl, which this platform does not have.')
+        self._version = 0
+        self._versions = {}
+        super().__init__(name, **options)
+
+    @property
+    def versions_path(self):
+        return self.folder + self.name + '.versions'
+
+    def _watched_paths(self):
+        return [self.versions_path]
+
+    def _acquire(self, mode):
+        handle = open(self.folder + self.name + '.lock', 'a')
+        fcntl.flock(handle, mode)
+        return handle
+
+    def _release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    @contextmanager
+    def _locked(self, mode):
+        handle = self._acquire(mode)
+        try:
+            yield
+        finally:
+            self._release(handle)
+
+    def _read_versions(self):
+        try:
+            with open(self.versions_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0, {}
+        return data['version'], data['keys']
+
+    def load_from_file(self):
+        # folding a leftover journal rewrites the file, which needs the lock to ourselves;
+        # whoever gets it second finds the journal gone and just reads
+        journal = os.path.exists(self.folder + self.name + '.journal')
+        with self._locked(fcntl.LOCK_EX if journal else fcntl.LOCK_SH):
+            super().load_from_file()
+            self._version, self._versions = self._read_versions()
+
+    def _read_changes(self):
+        # must hold the file lock, returns the values of keys other processes changed
+        version, versions = self._read_versions()
+        if version == self._version:
+            return version, versions, {}
+
+        with open(self.folder + self.name, 'r') as f:
+            disk = json.load(f, object_hook=self.object_hook)
+
+        changed = {}
+        for key in set(versions) | set(self._versions):
+            if versions.get(key) != self._versions.get(key):
+                changed[key] = disk[key] if key in versions and key in disk else _REMOVED
+        return version, versions, changed
+
+    def _merge(self, version, versions, changed, skip=()):
+        for key, value in changed.items():
+            # our own unsaved changes win, they get written with a newer stamp
+            if key in skip or key in self._dirty:
+                continue
+            self.generation += 1
+            if value is _REMOVED:
+                self._db.pop(key, None)
+            else:
+                self._db[key] = value
+            self._fragments.pop(key, None)
+            self._invalidate(key)
+        self._version = version
+        self._versions = dict(versions)
+
+    def _write_versions(self, dirty):
+        version = self._version + 1
+        versions = dict(self._versions)
+        for key in dirty:
+            if key in self._db:
+                versions[str(key)] = version
+            else:
+                versions.pop(str(key), None)
+
+        # stamps go first: after a crash the others re-read keys that did not change,
+        # rather than never noticing keys that did
+        temp = '%s-%s.tmp' % (self.versions_path, uuid.uuid4())
+        with open(temp, 'w') as tmp:
+            json.dump({'version': version, 'keys': versions}, tmp, separators=(',', ':'))
+        os.replace(temp, self.versions_path)
+        self._dump(dirty)
+        self._version, self._versions = version, versions
+
+    async def _save(self, everything=False):
+        with await self.lock:
+            dirty, self._dirty = self._dirty, set()
+            if everything:
+                # anything may have been changed in place, so our copy of every key wins
+                dirty.update(self._db)
+            handle = await self.loop.run_in_executor(self.executor, self._acquire, fcntl.LOCK_EX)
+            try:
+                version, versions, changed = await self.loop.run_in_executor(self.executor, self._read_changes)
+                self._merge(version, versions, changed, dirty)
+                await self.loop.run_in_executor(self.executor, self._write_versions, dirty)
+            finally:
+                self._release(handle)
+            self._seen = self._stat()
+
+    async def refresh(self):
+        """Pulls in the keys other processes changed since we last looked."""
+        with await self.lock:
+            handle = await self.loop.run_in_executor(self.executor, self._acquire, fcntl.LOCK_SH)
+            try:
+                version, versions, changed = await self.loop.run_in_executor(self.executor, self._read_changes)
+                self._merge(version, versions, changed)
+            finally:
+                self._release(handle)
+            self._seen = self._stat()
+
+    async def reload_if_changed(self):
+        """Merges in changes made by other processes, keeping local ones."""
+        if not self.ready.is_set() or self._stat() == self._seen:
+            return False
+        await self.refresh()
+        return True
+
+
+class SqliteConfig(Config):
+    """A Config stored in SQLite, one row per top-level key.
+
+    Saves only touch the rows of keys changed since the last save, and every
+    database call goes through a single worker thread. Existing JSON files
+    are moved into the database with :func:`convert`.
+    """
+
+    def __init__(self, name, **options):
+        options.setdefault('executor', ThreadPoolExecutor(max_workers=1))
+        self._conn = None
+        super().__init__(name, **options)
+
+    @property
+    def database(self):
+        return self.folder + os.path.splitext(self.name)[0] + '.db'
+
+    def _watched_paths(self):
+        return [self.database]
+
+    def _connect(self):
+        if self._conn is None:
+            # only ever used from one thread at a time, guarded by the lock
+            self._conn = sqlite3.connect(self.database, check_same_thread=False)
+            self._conn.execute(_SQLITE_SCHEMA)
+        return self._conn
+
+    def load_from_file(self):
+        rows = self._connect().execute('SELECT key, value FROM config')
+        self._db = {key: json.loads(value, object_hook=self.object_hook) for key, value in rows}
+
+    def _encode(self, value):
+        return json.dumps(value, ensure_ascii=True, cls=self.encoder, separators=(',', ':'))
+
+    def _dump(self, dirty=None):
+        conn = self._connect()
+        with conn:
+            if dirty is None:
+                conn.execute('DELETE FROM config')
+                dirty = list(self._db)
+
+            for key in dirty:
+                if key in self._db:
+                    conn.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)',
+                                 (key, self._encode(self._db[key])))
+                else:
+                    conn.execute('DELETE FROM config WHERE key = ?', (key,))
+
+
+_SQLITE_SCHEMA = 'CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+
+
+def migrate_json(source, database):
+    """Copies a JSON data file into a SQLite database readable by :class:`SqliteConfig`.
+
+    Whatever the database held before is replaced.
+    """
+    data = read_json(source)
+    conn = sqlite3.connect(database)
+    try:
+        with conn:
+            conn.execute(_SQLITE_SCHEMA)
+            conn.execute('DELETE FROM config')
+            conn.executemany('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)',
+                             ((key, json.dumps(value, ensure_ascii=True, separators=(',', ':')))
+                              for key, value in data.items()))
+    finally:
+        conn.close()
+
+
+def sqlite_to_json(database, destination):
+    """Writes the contents of a :class:`SqliteConfig` database back into a plain JSON data file."""
+    conn = sqlite3.connect(database)
+    try:
+        data = {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM config')}
+    finally:
+        conn.close()
+    _write_json(destination, data)
+    _drop_journal(destination)
+
+
+class LazyConfig(Config):
+    """Base for Configs that only decode a top-level key when it is first read.
+
+    Subclasses track every stored key in ``_keys``, implement ``_read_key`` to
+    fetch a single value and ``_write`` to persist a list of ``(key, value)``
+    changes. With ``max_loaded`` set, the least recently used entries without
+    pending changes are dropped from memory once more than that many are loaded.
+    """
+
+    def __init__(self, name, **options):
+        self.max_loaded = options.pop('max_loaded', None)
+        self._writing = set()
+        super().__init__(name, **options)
+
+    def _clear(self):
+        self._db = OrderedDict()
+        self._keys = set()
+
+    def _apply(self, key, value):
+        if value is _REMOVED:
+            self._keys.discard(key)
+        else:
+            self._keys.add(key)
+        super()._apply(key, value)
+
+    def _read_key(self, key):
+        raise NotImplementedError
+
+    def _write(self, changes):
+        raise NotImplementedError
+
+    def _load(self, key):
+        if key in self._db:
+            self._db.move_to_end(key)
+            return self._db[key]
+
+        if key not in self._keys:
+            raise KeyError(key)
+
+        value = self._db[key] = self._read_key(key)
+        self._evict()
+        return value
+
+    def _evict(self):
+        if not self.max_loaded:
+            return
+
+        excess = len(self._db) - self.max_loaded
+        for key in list(self._db):
+            if excess <= 0:
+                break
+            if key not in self._dirty and key not in self._writing:
+                del self._db[key]
+                excess -= 1
+
+    def _dump(self, dirty=None):
+        if dirty is None:
+            dirty = list(self._db)
+        self._write([(key, self._db.get(key, _REMOVED)) for key in dirty])
+
+    async def _save(self, everything=False):
+        with await self.lock:
+            dirty, self._dirty = self._dirty, set()
+            if everything:
+                # only loaded values can have been changed in place
+                dirty.update(self._db)
+            # grab the values now so an eviction can't race the writer thread
+            changes = [(key, self._db[key] if key in self._keys else _REMOVED) for key in dirty]
+            self._writing.update(dirty)
+            try:
+                await self.loop.run_in_executor(self.executor, self._write, changes)
+            finally:
+                self._writing.difference_update(dirty)
+            self._seen = self._stat()
+
+    def get(self, key, *args):
+        """Retrieves a data entry, loading it if needed."""
+        try:
+            return self._load(key)
+        except KeyError:
+            return args[0] if args else None
+
+    async def put(self, key, value, *args, changed=None):
+        """Edits a data entry."""
+        self._keys.add(key)
+        self._db[key] = value
+        self._db.move_to_end(key)
+        self._record(key, value)
+        self._dirty.add(key)
+        self._invalidate(key, changed)
+        self._evict()
+        await self._changed()
+
+    async def remove(self, key):
+        """Removes a data entry."""
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.discard(key)
+        self._db.pop(key, None)
+        self._record(key, _REMOVED)
+        self._dirty.add(key)
+        self._invalidate(key)
+        await self._changed()
+
+    def __contains__(self, item):
+        return item in self._keys
+
+    def __getitem__(self, item):
+        return self._load(item)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def all(self):
+        """Returns every entry. This has to load every key."""
+        return {key: self._load(key) for key in list(self._keys)}
+
+
+class ShardedConfig(LazyConfig):
+    """A Config that keeps every top-level key in its own file.
+
+    Shards live in a folder named after the config and are only read the first
+    time their key is accessed. Saves rewrite just the shards that changed.
+    Existing JSON files are split into shards with :func:`convert`.
+    """
+
+    @property
+    def shard_folder(self):
+        return self.folder + os.path.splitext(self.name)[0] + '/'
+
+    def _watched_paths(self):
+        # replacing or removing a shard bumps the folder's mtime
+        return [self.shard_folder]
+
+    def _shard_path(self, key):
+        return self.shard_folder + quote(str(key), safe='') + '.json'
+
+    def load_from_file(self):
+        # loaded shards, least recently used first
+        self._db = OrderedDict()
+        os.makedirs(self.shard_folder, exist_ok=True)
+        self._keys = set(unquote(f[:-5]) for f in os.listdir(self.shard_folder) if f.endswith('.json'))
+
+    def _read_key(self, key):
+        with open(self._shard_path(key), 'r') as f:
+            return json.load(f, object_hook=self.object_hook)
+
+    def _write(self, changes):
+        for key, value in changes:
+            path = self._shard_path(key)
+            if value is _REMOVED:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+
+            temp = '%s-%s.tmp' % (path, uuid.uuid4())
+            with open(temp, 'w', encoding='utf-8') as tmp:
+                json.dump(value, tmp, ensure_ascii=True, cls=self.encoder, separators=(',', ':'))
+            os.replace(temp, path)
+
+
+class BinaryConfig(LazyConfig):
+    """A Config stored in an indexed binary snapshot that is read through ``mmap``.
+
+    Loading only parses the key index; each value is decoded the first time it
+    is accessed. Saves write a new snapshot next to the old one and swap it in
+    with ``os.replace``, copying the raw bytes of unchanged keys instead of
+    re-encoding them. See :func:`json_to_binary` for the file layout, and
+    :func:`convert` to turn an existing JSON file into a snapshot.
+    """
+
+    def __init__(self, name, **options):
+        # (mmap of the snapshot, key index into it), swapped as one attribute so a
+        # reader never pairs the index of one snapshot with the map of another
+        self._mapped = (None, {})
+        super().__init__(name, **options)
+
+    @property
+    def snapshot(self):
+        return self.folder + os.path.splitext(self.name)[0] + '.bin'
+
+    def _watched_paths(self):
+        return [self.snapshot]
+
+    def _open(self):
+        try:
+            with open(self.snapshot, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None, {}
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None, {}
+        return mapped, _read_index(mapped)
+
+    def load_from_file(self):
+        # open first, a broken snapshot must leave the loaded one alone
+        mapped = self._open()
+        self._db = OrderedDict()
+        self._mapped = mapped
+        self._keys = set(mapped[1])
+
+    def _read_key(self, key):
+        mapped, index = self._mapped
+        offset, length = index[key]
+        return json.loads(mapped[offset:offset + length].decode('utf-8'), object_hook=self.object_hook)
+
+    def _write(self, changes):
+        mapped, index = self._mapped
+        entries = {key: (mapped, offset, length) for key, (offset, length) in index.items()}
+        for key, value in changes:
+            if value is _REMOVED:
+                entries.pop(key, None)
+            else:
+                entries[key] = json.dumps(value, ensure_ascii=True, cls=self.encoder, separators=(',', ':')).encode('utf-8')
+
+        temp = '%s-%s.tmp' % (self.snapshot, uuid.uuid4())
+        with open(temp, 'wb') as tmp:
+            _write_binary(tmp, entries)
+        os.replace(temp, self.snapshot)
+
+        # readers on the loop may still be using the old map, so leave closing it to the GC
+        self._mapped = self._open()
+
+
+_REMOVED = object()
+
+
+def split_json(source, folder):
+    """Splits a JSON data file into the per-key shards used by :class:`ShardedConfig`.
+
+    Shards already in the folder are replaced.
+    """
+    data = read_json(source)
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(folder + name)
+    for key, value in data.items():
+        with open(folder + quote(str(key), safe='') + '.json', 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=True, separators=(',', ':'))
+
+
+def join_shards(folder, destination):
+    """Writes the shards of a :class:`ShardedConfig` back into one JSON file and removes them.
+
+    Any journal next to the file is removed too, the shards were split off after it.
+    """
+    data = {}
+    for name in os.listdir(folder):
+        if name.endswith('.json'):
+            with open(folder + name, 'r', encoding='utf-8') as f:
+                data[unquote(name[:-5])] = json.load(f)
+    _write_json(destination, data)
+    _drop_journal(destination)
+    for name in os.listdir(folder):
+        os.remove(folder + name)
+    os.rmdir(folder)
+
+
+# binary snapshot layout, all little endian:
+#   header: magic, format version, number of keys
+#   index:  per key a length-prefixed utf-8 key, then the offset and length of its value
+#   data:   the JSON encoded values, back to back
+_BINARY_MAGIC = b'DBCF'
+_BINARY_HEADER = struct.Struct('<4sHI')
+_BINARY_KEY = struct.Struct('<H')
+_BINARY_SPAN = struct.Struct('<QI')
+
+
+def _read_index(mapped):
+    magic, version, count = _BINARY_HEADER.unpack_from(mapped, 0)
+    if magic != _BINARY_MAGIC or version != 1:
+        raise ValueError('Not a binary config snapshot.')
+
+    index = {}
+    position = _BINARY_HEADER.size
+    for _ in range(count):
+        key_length, = _BINARY_KEY.unpack_from(mapped, position)
+        position += _BINARY_KEY.size
+        key = mapped[position:position + key_length].decode('utf-8')
+        position += key_length
+        index[key] = _BINARY_SPAN.unpack_from(mapped, position)
+        position += _BINARY_SPAN.size
+    return index
+
+
+def _write_binary(f, entries):
+    # entries maps key -> encoded bytes or a (mapped file, offset, length) slice
+    keys = [(key, str(key).encode('utf-8')) for key in entries]
+    spans = []
+    offset = _BINARY_HEADER.size + sum(_BINARY_KEY.size + len(raw) + _BINARY_SPAN.size for _, raw in keys)
+    for key, _ in keys:
+        entry = entries[key]
+        length = len(entry) if isinstance(entry, bytes) else entry[2]
+        spans.append((offset, length))
+        offset += length
+
+    f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, 1, len(keys)))
+    for (_, raw), span in zip(keys, spans):
+        f.write(_BINARY_KEY.pack(len(raw)))
+        f.write(raw)
+        f.write(_BINARY_SPAN.pack(*span))
+
+    for key, _ in keys:
+        entry = entries[key]
+        if isinstance(entry, bytes):
+            f.write(entry)
+        else:
+            mapped, start, length = entry
+            f.write(mapped[start:start + length])
+
+
+def json_to_binary(source, destination):
+    """Converts a JSON data file into a snapshot readable by :class:`BinaryConfig`."""
+    data = read_json(source)
+    entries = {str(key): json.dumps(value, ensure_ascii=True, separators=(',', ':')).encode('utf-8')
+               for key, value in data.items()}
+    temp = '%s-%s.tmp' % (destination, uuid.uuid4())
+    with open(temp, 'wb') as f:
+        _write_binary(f, entries)
+    os.replace(temp, destination)
+
+
+def binary_to_json(source, destination):
+    """Converts a :class:`BinaryConfig` snapshot back into a plain JSON data file."""
+    with open(source, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            index = _read_index(mapped)
+            temp = '%s-%s.tmp' % (destination, uuid.uuid4())
+            with open(temp, 'w', encoding='utf-8') as out:
+                separator = '{'
+                for key, (offset, length) in index.items():
+                    out.write(separator)
+                    out.write(json.dumps(key))
+                    out.write(':')
+                    out.write(mapped[offset:offset + length].decode('utf-8'))
+                    separator = ','
+                out.write('}' if separator == ',' else '{}')
+    os.replace(temp, destination)
+    _drop_journal(destination)
+
+
+def _replay_journal(data, path, object_hook=None):
+    # applies the records of a journal to data and returns the journal's size
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line, object_hook=object_hook)
+                except ValueError:
+                    # torn write from a crash, nothing after it can be trusted
+                    break
+
+                if record[0] == 'put':
+                    data[record[1]] = record[2]
+                else:
+                    data.pop(record[1], None)
+            return f.tell()
+    except FileNotFoundError:
+        return 0
+
+
+def read_json(path):
+    """Reads a JSON data file, including any journal written by :class:`JournalConfig`."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    _replay_journal(data, path + '.journal')
+    return data
+
+
+def _write_json(path, data):
+    temp = '%s-%s.tmp' % (path, uuid.uuid4())
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=True, separators=(',', ':'))
+    os.replace(temp, path)
+
+
+def fold_journal(path):
+    """Writes the records of a :class:`JournalConfig` journal into its JSON file and removes the journal."""
+    _write_json(path, read_json(path))
+    os.remove(path + '.journal')
+
+
+def _drop_journal(path):
+    # the JSON file was just rewritten from elsewhere, records meant for the old one are stale
+    try:
+        os.remove(path + '.journal')
+    except FileNotFoundError:
+        pass
+
+
+def _has_json(path):
+    return os.path.exists(path) or os.path.exists(path + '.journal')
+
+
+def _store(backend, path):
+    # the file or folder holding the data of a backend
+    stem = os.path.splitext(path)[0]
+    return {'sqlite': stem + '.db', 'sharded': stem + '/', 'binary': stem + '.bin'}.get(backend, path)
+
+
+def _export_journal(store, path):
+    if os.path.exists(path + '.journal'):
+        fold_journal(path)
+
+
+# backend: (move its data into the JSON file, move the JSON file into it), by store paths
+_CONVERTERS = {
+    'json': (None, None),
+    'shared': (None, None),
+    'journal': (_export_journal, None),
+    'sqlite': (sqlite_to_json, migrate_json),
+    'sharded': (join_shards, split_json),
+    'binary': (binary_to_json, json_to_binary),
+}
+
+
+def convert(name, source, target, directory="data"):
+    """Moves a data file from one storage backend to another.
+
+    Backends never migrate data on their own, so this has to be run, with the
+    bot stopped, before ``meta.storage`` is switched. Every conversion goes
+    through the plain JSON file, which is rewritten on the way, and replaces
+    whatever the target backend held before. The source is left in place
+    except for journals and shard folders, which are folded into the JSON file.
+    """
+    for backend in (source, target):
+        if backend not in _CONVERTERS:
+            raise ValueError('Unknown storage backend "{}".'.format(backend))
+
+    path = (directory + "/" if directory else "") + name
+    store = _store(source, path)
+    if not (_has_json(store) if store == path else os.path.exists(store)):
+        raise FileNotFoundError('No {} data found at {}.'.format(source, store))
+
+    export, _ = _CONVERTERS[source]
+    if export is not None:
+        export(store, path)
+    _, load = _CONVERTERS[target]
+    if load is not None:
+        load(path, _store(target, path))
+
+
+BACKENDS = {
+    'json': Config,
+    'journal': JournalConfig,
+    'sqlite': SqliteConfig,
+    'sharded': ShardedConfig,
+    'binary': BinaryConfig,
+    'shared': SharedConfig,
+}
+
+
+def open_config(name, **options):
+    """Returns the shared Config for a data file, creating it on first use.
+
+    Everyone asking for the same directory and name gets the same live
+    instance, so a file is only parsed once per process. ``backend`` names the
+    storage backend used when the instance is first created.
+    """
+    key = (os.path.abspath(options.get('directory', "data") or '.'), name)
+    try:
+        return _registry[key]
+    except KeyError:
+        pass
+
+    backend = options.pop('backend', 'json')
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Unknown storage backend "{}".'.format(backend)) from None
+    cfg = _registry[key] = cls(name, **options)
+    return cfg
+
+
+async def watch(interval=5.0, log=None):
+    """Reloads shared Configs whose files change on disk, checking every ``interval`` seconds.
+
+    A file that fails to load, e.g. because it was saved by hand with a typo,
+    is reported to ``log`` (or stderr) and its last good data is kept until
+    the file changes again.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for cfg in list(_registry.values()):
+            try:
+                await cfg.reload_if_changed()
+            except Exception:
+                # don't retry the same broken file every interval
+                cfg._seen = cfg._stat()
+                message = 'Could not reload {}, keeping the data loaded before'.format(cfg.folder + cfg.name)
+                if log is not None:
+                    log.exception(message)
+                else:
+                    print(message + ':', file=sys.stderr)
+                    traceback.print_exc()
+
+
+async def load_pending():
+    """Loads every Config created with ``load_later`` concurrently.
+
+    Returns a list of ``(path, seconds)`` pairs with how long each file took
+    to load, slowest first.
+    """
+    configs = list(_pending)
+    tasks = [c._start_load() for c in configs]
+    await asyncio.gather(*(t for t in tasks if t is not None))
+    timings = [(c.folder + c.name, c.load_time) for c in configs]
+    return sorted(timings, key=lambda t: t[1], reverse=True)
+
+
+async def flush_all():
+    """Flushes every Config that still has pending changes."""
+    await asyncio.gather(*(c.flush() for c in list(_instances) if c.dirty))
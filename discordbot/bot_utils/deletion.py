@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+from collections import Counter
+
+import discord
+
+# Discord only bulk deletes messages younger than this, and at most this many at once
+BULK_DELETE_AGE = datetime.timedelta(days=14)
+BULK_DELETE_LIMIT = 100
+
+
+class TokenBucket:
+    """Hands out ``rate`` tokens a second, with bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity, *, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = self.loop.time()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            now = self.loop.time()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class MessageDeleter:
+    """Deletes the messages of a channel that pass a check.
+
+    The channel history is streamed page by page. Messages younger than two
+    weeks are deleted in batches of up to 100 when ``bulk`` is set, which
+    requires Manage Messages. Everything else is deleted one at a time, paced
+    by a :class:`TokenBucket` rather than fixed sleeps.
+
+    Parameters
+    ------------
+    bot
+        The bot instance.
+    channel
+        The channel to clean up.
+    bulk: bool
+        Whether bulk deletes can be used.
+    rate: float
+        How many single deletes to start per second.
+    burst: int
+        How many single deletes may be started at once.
+    """
+
+    def __init__(self, bot, channel, *, bulk=True, rate=4.5, burst=5):
+        self.bot = bot
+        self.channel = channel
+        self.bulk = bulk
+        self.bucket = TokenBucket(rate, burst, loop=bot.loop)
+        self.scanned = 0
+        # author display name: messages deleted
+        self.deleted = Counter()
+        self.started = None
+        self._pending = set()
+
+    @property
+    def total(self):
+        return sum(self.deleted.values())
+
+    @property
+    def elapsed(self):
+        return self.bot.loop.time() - self.started if self.started is not None else 0.0
+
+    @property
+    def throughput(self):
+        """Messages deleted per second so far."""
+        elapsed = self.elapsed
+        return self.total / elapsed if elapsed else 0.0
+
+    async def _delete(self, message):
+        try:
+            await self.bot.delete_message(message)
+        except discord.HTTPException:
+            # not ours to delete or already gone
+            return
+        self.deleted[message.author.display_name] += 1
+
+    async def _delete_single(self, message):
+        await self.bucket.acquire()
+        task = self.bot.loop.create_task(self._delete(message))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _delete_bulk(self, batch):
+        if len(batch) == 1:
+            return await self._delete_single(batch[0])
+
+        try:
+            await self.bot.delete_messages(batch)
+        except discord.HTTPException:
+            # one bad message fails the whole batch, so fall back to deleting them one by one
+            for message in batch:
+                await self._delete_single(message)
+        else:
+            self.deleted.update(message.author.display_name for message in batch)
+
+    async def run(self, limit, *, before=None, check=None, progress=None, progress_interval=5.0):
+        """Searches the last ``limit`` messages and deletes those passing ``check``.
+
+        ``progress`` is an optional coroutine function that is called with the
+        deleter every ``progress_interval`` seconds. Returns :attr:`deleted`.
+        """
+        loop = self.bot.loop
+        self.started = loop.time()
+        next_report = self.started + progress_interval
+        # a little margin so messages don't age out while the batch is being sent
+        cutoff = datetime.datetime.utcnow() - BULK_DELETE_AGE + datetime.timedelta(minutes=1)
+        batch = []
+
+        async for message in self.bot.logs_from(self.channel, limit=limit, before=before):
+            self.scanned += 1
+            if check is None or check(message):
+                if self.bulk and message.timestamp > cutoff:
+                    batch.append(message)
+                    if len(batch) == BULK_DELETE_LIMIT:
+                        await self._delete_bulk(batch)
+                        batch = []
+                else:
+                    await self._delete_single(message)
+
+            if progress is not None and loop.time() >= next_report:
+                await progress(self)
+                next_report = loop.time() + progress_interval
+
+        if batch:
+            await self._delete_bulk(batch)
+        if self._pending:
+            await asyncio.wait(set(self._pending))
+        return self.deleted
@@ -0,0 +1,65 @@
+import asyncio
+import weakref
+
+import discord
+
+
+class ReactionDispatcher:
+    """Sends trigger responses and emoji reactions without serial round trips.
+
+    Calls are queued per channel and up to ``concurrency`` of them are in
+    flight at once, roughly the burst Discord's reaction route allows before
+    rate limiting kicks in. Responses keep their order, reactions are
+    pipelined next to them and the same emoji is only added once per message.
+
+    Parameters
+    ------------
+    bot
+        The bot instance.
+    concurrency
+        How many calls may be in flight per channel.
+    """
+
+    def __init__(self, bot, *, concurrency=4):
+        self.bot = bot
+        self.concurrency = concurrency
+        # channel id: Semaphore, dropped once nothing is queued on the channel
+        self._channels = weakref.WeakValueDictionary()
+
+    def _budget(self, channel):
+        budget = self._channels.get(channel.id)
+        if budget is None:
+            budget = self._channels[channel.id] = asyncio.Semaphore(self.concurrency)
+        return budget
+
+    async def _call(self, budget, method, *args):
+        async with budget:
+            try:
+                return await method(*args)
+            except discord.HTTPException:
+                # e.g. a custom emoji that no longer exists, the others should still go out
+                pass
+
+    async def _respond(self, budget, channel, responses):
+        for response in responses:
+            await self._call(budget, self.bot.send_message, channel, response)
+
+    async def dispatch(self, message, *, responses=(), reactions=()):
+        """Sends ``responses`` to the message's channel and adds ``reactions`` to it."""
+        budget = self._budget(message.channel)
+        calls = [self._call(budget, self.bot.add_reaction, message, emoji) for emoji in unique(reactions)]
+        if responses:
+            calls.append(self._respond(budget, message.channel, responses))
+        if calls:
+            await asyncio.gather(*calls)
+
+
+def unique(items):
+    """Returns the items without duplicates, keeping their first-seen order."""
+    seen = set()
+    result = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
@@ -0,0 +1,99 @@
+from collections import deque
+
+# characters that may follow a trigger for it to count as a whole word
+WORD_END = frozenset(" .!?,'")
+
+
+class TriggerMatcher:
+    """Finds which of many trigger phrases occur in a message in one pass.
+
+    The triggers are compiled into an Aho-Corasick automaton, so matching
+    costs O(message length + matches) no matter how many triggers there are.
+    Matching is case insensitive, the text to match is expected in lower case
+    already, e.g. :attr:`MessageContext.content_lower`. A trigger only fires if its first occurrence
+    ends the message or is followed by one of :data:`WORD_END`.
+
+    Parameters
+    ------------
+    triggers
+        An iterable of trigger phrases, in the order they should fire.
+    """
+
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+        # state 0 is the root, every state has transitions, a fail link and outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._patterns = []
+        self._empty = []
+
+        ids = {}
+        for position, trigger in enumerate(self.triggers):
+            pattern = trigger.lower()
+            if not pattern:
+                self._empty.append(position)
+                continue
+            if pattern in ids:
+                self._patterns[ids[pattern]][1].append(position)
+                continue
+            ids[pattern] = len(self._patterns)
+            self._patterns.append((len(pattern), [position]))
+            self._add(pattern, ids[pattern])
+
+        self._link()
+
+    def _add(self, pattern, pattern_id):
+        state = 0
+        for char in pattern:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = following
+            state = following
+        self._output[state].append(pattern_id)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                # inherit the matches of the longest proper suffix
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def match(self, text):
+        """Returns the triggers that fire for the lower case ``text``, in trigger order."""
+        goto, fail, output = self._goto, self._fail, self._output
+
+        # end index of the first occurrence of every pattern
+        first = {}
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                if pattern_id not in first:
+                    first[pattern_id] = end
+
+        length = len(text)
+        fired = []
+        for pattern_id, end in first.items():
+            if end >= length or text[end] in WORD_END:
+                fired.extend(self._patterns[pattern_id][1])
+
+        if self._empty and (not text or text[0] in WORD_END):
+            fired.extend(self._empty)
+
+        return [self.triggers[position] for position in sorted(fired)]
@@ -0,0 +1,173 @@
+import asyncio
+from collections import Counter
+
+import discord
+
+# users in more servers than this get a set of server ids instead of a tuple
+SMALL_ENTRY = 8
+
+
+def _is_online(member):
+    return member.status != discord.Status.offline
+
+
+class PopulationTracker:
+    """Keeps member and channel counts across every server the bot is in.
+
+    The counts are taken in full when the bot becomes ready and then kept up
+    to date from member, presence, server and channel events, so reading
+    them is O(1). Events that discord.py applies without dispatching, e.g.
+    member chunks, can make the counts drift; :meth:`recount` corrects that.
+
+    It also indexes which servers each user is in. Server ids are kept as
+    ints, a user in one server maps to that id and a user in a few servers
+    to a tuple, only users in many servers get a set.
+
+    Parameters
+    ------------
+    bot
+        The bot instance.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.total = 0
+        self.online = 0
+        # ChannelType: channels of that type
+        self.channel_types = Counter()
+        # user id: int server id, tuple or set of them
+        self._servers_of = {}
+        # user id: servers they are online in
+        self._online = Counter()
+
+    @property
+    def unique(self):
+        return len(self._servers_of)
+
+    @property
+    def unique_online(self):
+        return len(self._online)
+
+    def install(self):
+        """Registers the listeners that keep the counts up to date."""
+        for name in ('on_ready', 'on_member_join', 'on_member_remove', 'on_member_update', 'on_server_join',
+                     'on_server_remove', 'on_channel_create', 'on_channel_delete'):
+            self.bot.add_listener(getattr(self, name), name)
+
+    def server_ids(self, user_id):
+        """Returns the ids of the servers a user shares with the bot."""
+        entry = self._servers_of.get(user_id, ())
+        if isinstance(entry, int):
+            return (str(entry),)
+        return tuple(map(str, entry))
+
+    def server_count(self, user_id):
+        """Returns how many servers a user shares with the bot."""
+        entry = self._servers_of.get(user_id, ())
+        return 1 if isinstance(entry, int) else len(entry)
+
+    def _link(self, user_id, server_id):
+        entry = self._servers_of.get(user_id)
+        if entry is None:
+            self._servers_of[user_id] = server_id
+        elif isinstance(entry, int):
+            if entry != server_id:
+                self._servers_of[user_id] = (entry, server_id)
+        elif isinstance(entry, tuple):
+            if server_id not in entry:
+                entry += (server_id,)
+                self._servers_of[user_id] = set(entry) if len(entry) > SMALL_ENTRY else entry
+        else:
+            entry.add(server_id)
+
+    def _unlink(self, user_id, server_id):
+        entry = self._servers_of.get(user_id)
+        if entry is None:
+            return
+        if isinstance(entry, int):
+            if entry == server_id:
+                del self._servers_of[user_id]
+        elif isinstance(entry, tuple):
+            rest = tuple(s for s in entry if s != server_id)
+            self._servers_of[user_id] = rest[0] if len(rest) == 1 else rest
+        else:
+            entry.discard(server_id)
+            # only shrink back well below the limit so a user at the edge doesn't flip every time
+            if len(entry) <= SMALL_ENTRY // 2:
+                self._servers_of[user_id] = tuple(entry)
+
+    def _add_member(self, member, server_id, sign=1):
+        self.total += sign
+        if sign > 0:
+            self._link(member.id, server_id)
+        else:
+            self._unlink(member.id, server_id)
+        if _is_online(member):
+            self._add_online(member, sign)
+
+    def _add_online(self, member, sign):
+        self.online += sign
+        self._online[member.id] += sign
+        if self._online[member.id] <= 0:
+            del self._online[member.id]
+
+    def _add_server(self, server, sign=1):
+        server_id = int(server.id)
+        for member in server.members:
+            self._add_member(member, server_id, sign)
+        for channel in server.channels:
+            self.channel_types[channel.type] += sign
+
+    def snapshot(self):
+        """Returns the counts as a dict."""
+        return {'total': self.total, 'online': self.online, 'unique': self.unique,
+                'unique_online': self.unique_online, 'text': self.channel_types[discord.ChannelType.text],
+                'voice': self.channel_types[discord.ChannelType.voice]}
+
+    def recount(self):
+        """Counts everything from scratch and returns how far off the kept counts were."""
+        before = self.snapshot()
+        self.total = self.online = 0
+        self.channel_types = Counter()
+        self._servers_of = {}
+        self._online = Counter()
+        for server in self.bot.servers:
+            self._add_server(server)
+        after = self.snapshot()
+        return {key: after[key] - before[key] for key in after if after[key] != before[key]}
+
+    async def recount_periodically(self, interval):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed:
+            await asyncio.sleep(interval)
+            drift = self.recount()
+            if drift:
+                self.bot.logs['info'].info('Population counts drifted by {}'.format(drift))
+
+    async def on_ready(self):
+        self.recount()
+
+    async def on_member_join(self, member):
+        self._add_member(member, int(member.server.id))
+
+    async def on_member_remove(self, member):
+        self._add_member(member, int(member.server.id), -1)
+
+    async def on_member_update(self, before, after):
+        was_online, is_online = _is_online(before), _is_online(after)
+        if was_online != is_online:
+            self._add_online(after, 1 if is_online else -1)
+
+    async def on_server_join(self, server):
+        self._add_server(server)
+
+    async def on_server_remove(self, server):
+        self._add_server(server, -1)
+
+    async def on_channel_create(self, channel):
+        if not channel.is_private:
+            self.channel_types[channel.type] += 1
+
+    async def on_channel_delete(self, channel):
+        if not channel.is_private:
+            self.channel_types[channel.type] -= 1
@@ -0,0 +1,87 @@
+import re
+
+
+def _as_tuple(prefixes):
+    if isinstance(prefixes, str):
+        return (prefixes,)
+    return tuple(prefixes)
+
+
+class PrefixResolver:
+    """Works out which command prefixes apply to a message.
+
+    Servers can have their own prefixes, kept in ``store`` under the server
+    id; everything else uses ``default``. The prefixes of each server are
+    cached together with a compiled pattern that finds the longest matching
+    prefix in a single pass. An instance can be used directly as a bot's
+    ``command_prefix``.
+
+    Parameters
+    ------------
+    bot
+        The bot instance.
+    default
+        The default prefix, a list of them or a callable taking the bot and
+        a message like ``command_prefix`` does. Callables are not cached.
+    store
+        The :class:`Config` holding per server prefixes.
+    """
+
+    def __init__(self, bot, default, store):
+        self.bot = bot
+        self.store = store
+        self.set_default(default)
+
+    def set_default(self, default):
+        self.default = default if callable(default) else _as_tuple(default)
+        # server id (None for the default): (stored prefixes, prefixes longest first, pattern)
+        self._cache = {}
+
+    @property
+    def default_prefix(self):
+        """The main default prefix, e.g. for presence messages."""
+        return '' if callable(self.default) else self.default[0]
+
+    @staticmethod
+    def _compile(source, prefixes):
+        ordered = tuple(sorted(set(_as_tuple(prefixes)), key=len, reverse=True))
+        return source, ordered, re.compile('|'.join(map(re.escape, ordered)))
+
+    def _resolve(self, message):
+        server_id = message.server.id if message.server else None
+        stored = self.store.get(server_id) if server_id else None
+        cached = self._cache.get(server_id)
+        # a hot reload of the store hands us new lists, so compare by identity
+        if cached is not None and cached[0] is stored:
+            return cached
+
+        if stored:
+            cached = self._cache[server_id] = self._compile(stored, stored)
+        elif callable(self.default):
+            return self._compile(None, self.default(self.bot, message))
+        else:
+            cached = self._cache[server_id] = self._compile(stored, self.default)
+        return cached
+
+    def prefixes(self, message):
+        """Returns the prefixes for a message, longest first."""
+        return list(self._resolve(message)[1])
+
+    def match(self, message):
+        """Returns the prefix the message starts with, or None."""
+        found = self._resolve(message)[2].match(message.content)
+        return found.group(0) if found else None
+
+    async def set(self, server_id, prefixes):
+        """Gives a server its own prefixes."""
+        self._cache.pop(server_id, None)
+        await self.store.put(server_id, list(_as_tuple(prefixes)))
+
+    async def reset(self, server_id):
+        """Makes a server go back to the default prefixes."""
+        self._cache.pop(server_id, None)
+        if server_id in self.store:
+            await self.store.remove(server_id)
+
+    def __call__(self, bot, message):
+        return self.prefixes(message)
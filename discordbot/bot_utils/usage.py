@@ -0,0 +1,82 @@
+import re
+import time
+from collections import Counter, deque
+
+# (seconds per bucket, buckets kept) from the finest resolution to the coarsest
+RESOLUTIONS = ((60, 60), (3600, 48), (86400, 30))
+
+_WINDOW = re.compile(r'^(?:last\s*)?(\d+)\s*(m|min|mins|minutes?|h|hrs?|hours?|d|days?)$', re.IGNORECASE)
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_window(text):
+    """Turns a window like ``24h``, ``7d`` or ``last 30m`` into seconds, or None."""
+    match = _WINDOW.match(text.strip())
+    if match is None:
+        return None
+    return int(match.group(1)) * _UNITS[match.group(2)[0].lower()]
+
+
+def longest_window():
+    return max(span * kept for span, kept in RESOLUTIONS)
+
+
+class UsageHistory:
+    """Counts of named events in time buckets.
+
+    Events are counted in per-minute buckets. When a level holds more
+    buckets than it keeps, its oldest one is rolled up into the next coarser
+    level, so memory stays bounded and each event lives in exactly one bucket.
+    Counts older than the coarsest level are dropped.
+    """
+
+    __slots__ = ('levels',)
+
+    def __init__(self):
+        # per resolution a deque of [bucket number, Counter], oldest first
+        self.levels = [deque() for _ in RESOLUTIONS]
+
+    def record(self, name, count=1, now=None):
+        now = time.time() if now is None else now
+        self._bucket(0, int(now // RESOLUTIONS[0][0]))[name] += count
+
+    def _bucket(self, level, number):
+        buckets = self.levels[level]
+        if buckets and buckets[-1][0] == number:
+            return buckets[-1][1]
+
+        while len(buckets) >= RESOLUTIONS[level][1]:
+            oldest, counts = buckets.popleft()
+            if level + 1 < len(RESOLUTIONS):
+                seconds = oldest * RESOLUTIONS[level][0]
+                self._bucket(level + 1, seconds // RESOLUTIONS[level + 1][0]).update(counts)
+
+        counts = Counter()
+        buckets.append([number, counts])
+        return counts
+
+    def counts(self, window, now=None):
+        """Returns the counts of the last ``window`` seconds.
+
+        Buckets that overlap the start of the window are counted in full, so
+        the answer is only as precise as the buckets that far back.
+        """
+        now = time.time() if now is None else now
+        start = now - window
+        total = Counter()
+        for (span, _), buckets in zip(RESOLUTIONS, self.levels):
+            for number, counts in reversed(buckets):
+                if (number + 1) * span <= start:
+                    break
+                total.update(counts)
+        return total
+
+    def to_json(self):
+        return [[[number, dict(counts)] for number, counts in buckets] for buckets in self.levels]
+
+    @classmethod
+    def from_json(cls, data):
+        history = cls()
+        for buckets, stored in zip(history.levels, data):
+            buckets.extend([number, Counter(counts)] for number, counts in stored)
+        return history
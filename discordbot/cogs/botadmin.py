@@ -1,41 +1,105 @@
 import argparse
 import asyncio
-from collections import Counter, defaultdict
+from collections import defaultdict
 
 import copy
 import discord
 from discord.ext import commands
 
 import discordbot.embeds
+from ..embeds import build_embed
 from ..bot_utils import checks
-from ..bot_utils import config
+from ..bot_utils.deletion import MessageDeleter
 from ..colors import Colors
 
 
+# how many DMs a digest holds before the oldest ones are dropped
+DIGEST_CAPACITY = 200
+# embed limits: fields per embed, characters per field and per embed
+DIGEST_FIELDS = 25
+DIGEST_FIELD_LENGTH = 1024
+DIGEST_EMBED_LENGTH = 5500
+
+# plonk and command lists of servers that have none
+EMPTY = frozenset()
+
+
 class Arguments(argparse.ArgumentParser):
     def error(self, message):
         raise RuntimeError(message)
 
 
+class GuildSnapshot:
+    """Everything the global check needs to know about one server."""
+
+    __slots__ = ('ignored', 'plonked', 'disabled')
+
+    def __init__(self, ignored, plonked, disabled):
+        self.ignored = ignored
+        self.plonked = plonked
+        self.disabled = disabled
+
+
 class BotAdmin:
     """Bot administration commands."""
 
     def __init__(self, bot):
         self.bot = bot
-        self.config = config.Config('botadmin.json', loop=bot.loop, directory="data")
+        self.config = bot.open_config('botadmin.json')
+
+        # the lists are stored as JSON arrays, these give O(1) lookups on them
+        self.config.add_index('ignored', 'ignored', frozenset, default=())
+        self.config.add_index('plonks', 'plonks', frozenset, default={}, per_key=True)
+        self.config.add_index('commands', 'commands', frozenset, default={}, per_key=True)
+
+        # guild_id: GuildSnapshot, thrown away whenever one of the indexes above is rebuilt
+        self._snapshots = {}
 
         # guild_id: set(user_id)
         self._recently_kicked = defaultdict(set)
 
+        # the owner's User, so forwarding DMs doesn't look them up every time
+        self._owner = None
+        # (author, content) of DMs waiting for the next digest
+        self._digest = []
+        self._digest_dropped = 0
+        self._digest_handle = None
+
+        bot.add_message_stage(self.mark_ignored, priority=0)
+        bot.add_message_stage(self.forward_dm, priority=50)
+
+    def __unload(self):
+        self.bot.remove_message_stage(self.mark_ignored)
+        self.bot.remove_message_stage(self.forward_dm)
+        self.bot.loop.create_task(self.flush_digest())
+
+    async def on_shutdown(self):
+        await self.flush_digest()
+
     def bot_user(self, message):
         return message.server.me if message.channel.is_private else self.bot.user
 
+    def snapshot(self, server_id):
+        """Returns the :class:`GuildSnapshot` of a server, None for private messages.
+
+        A snapshot is only rebuilt once the ignore list or that server's plonk
+        or command list changed, which the indexes signal by handing out new sets.
+        """
+        index = self.config.index
+        ignored = index('ignored')
+        plonked = index('plonks').get(server_id, EMPTY)
+        disabled = index('commands').get(server_id, EMPTY)
+
+        snapshot = self._snapshots.get(server_id)
+        if (snapshot is None or snapshot.ignored is not ignored or snapshot.plonked is not plonked or
+                snapshot.disabled is not disabled):
+            snapshot = self._snapshots[server_id] = GuildSnapshot(ignored, plonked, disabled)
+        return snapshot
+
     def is_plonked(self, server, member):
-        db = self.config.get('plonks', {}).get(server.id, [])
-        bypass_ignore = member.server_permissions.manage_server
-        if not bypass_ignore and member.id in db:
-            return True
-        return False
+        if member.id not in self.snapshot(server.id).plonked:
+            return False
+        return not member.server_permissions.manage_server
 
     def __check(self, ctx):
         msg = ctx.message
@@ -43,48 +107,45 @@ class BotAdmin:
         if checks.is_owner_check(msg):
             return True
 
-        # user is bot banned
-        if msg.server:
-            if self.is_plonked(msg.server, msg.author):
-                return False
-
-        # check if the channel is ignored
-        # but first, resolve their permissions
-
-        perms = msg.channel.permissions_for(msg.author)
-        bypass_ignore = perms.administrator
+        snapshot = self.snapshot(msg.server.id if msg.server else None)
 
-        # now we can finally realise if we can actually bypass the ignore.
+        # user is bot banned
+        if msg.author.id in snapshot.plonked and not msg.author.server_permissions.manage_server:
+            return False
 
-        if not bypass_ignore and msg.channel.id in self.config.get('ignored', []):
+        # only resolve permissions when the channel is ignored, admins can bypass that
+        if msg.channel.id in snapshot.ignored and not checks.permissions.permissions_for(msg.channel, msg.author).administrator:
             return False
 
-        if checks.is_owner_check(msg):
-            return True
+        return ctx.command.qualified_name.split(' ')[0] not in snapshot.disabled
 
-        try:
-            entry = self.config.get('commands', {}).get(msg.server.id, [])
-        except (KeyError, AttributeError):
-            return True
-        else:
-            name = ctx.command.qualified_name.split(' ')[0]
-            return name not in entry
+    async def mark_ignored(self, ctx):
+        if not ctx.is_private:
+            await self.config.wait_until_ready()
+            ctx.ignored = ctx.message.channel.id in self.config.index('ignored')
 
-    async def on_message(self, message):
-        if message.author.bot:
-            return
+    async def get_owner(self):
+        owner_id = checks.owner_id()
+        if self._owner is None or self._owner.id != owner_id:
+            self._owner = await self.bot.get_user_info(owner_id)
+        return self._owner
 
-        if message.channel.is_private and not message.content.startswith(self.bot.command_prefix):
-            owner_id = self.bot.config.get("meta", {}).get("owner", "249746236008169473")
-            to_send = self.bot.config.get("meta", {}).get("send_dms", True)
+    async def forward_dm(self, ctx):
+        message = ctx.message
+        if ctx.is_private and not ctx.has_prefix:
+            meta = self.bot.config.get("meta", {})
+            to_send = meta.get("send_dms", True)
             image = ""
             embed = {}
             if message.embeds:
                 embed = message.embeds[0]
             if message.attachments:
                 image = message.attachments[0]['url']
-            if message.author.id != owner_id and to_send:
-                owner = await self.bot.get_user_info(owner_id)
+            if message.author.id != checks.owner_id() and to_send:
+                if meta.get("dm_digest", 0):
+                    return self.add_to_digest(message, embed, image, meta["dm_digest"])
+
+                owner = await self.get_owner()
                 if message.content:
                     await self.bot.responses.basic(destination=owner, message=message.content, author=str(message.author), author_img=message.author.avatar_url, color=Colors.get_default(self.bot), image=image)
                 if embed:
@@ -96,6 +157,57 @@ class BotAdmin:
                     e.set_author(name="Embed from " + str(message.author), icon_url=message.author.avatar_url)
                     await self.bot.send_message(destination=owner, embed=e)
 
+    def add_to_digest(self, message, embed, image, window):
+        content = message.content
+        if embed:
+            content += '\n[embed] {}'.format(embed.get('title') or embed.get('description', ''))
+        if image:
+            content += '\n' + image
+
+        if len(self._digest) >= DIGEST_CAPACITY:
+            del self._digest[0]
+            self._digest_dropped += 1
+        self._digest.append((str(message.author), content.strip()))
+
+        if self._digest_handle is None:
+            self._digest_handle = self.bot.loop.call_later(window, lambda: self.bot.loop.create_task(self.flush_digest()))
+
+    def build_digest(self, entries, dropped):
+        pages = []
+        fields = []
+        length = 0
+        for author, content in entries:
+            content = content or '*empty message*'
+            if len(content) > DIGEST_FIELD_LENGTH:
+                content = content[:DIGEST_FIELD_LENGTH - 3] + '...'
+            if len(fields) == DIGEST_FIELDS or length + len(author) + len(content) > DIGEST_EMBED_LENGTH:
+                pages.append(fields)
+                fields = []
+                length = 0
+            fields.append({"name": author, "value": content, "inline": False})
+            length += len(author) + len(content)
+        pages.append(fields)
+
+        title = "{} DMs received".format(len(entries))
+        footer = "{} older DMs were dropped".format(dropped) if dropped else ""
+        return [build_embed(title=title if i == 0 else "", sections=sections, footer=footer,
+                            color=Colors.get_default(self.bot))
+                for i, sections in enumerate(pages)]
+
+    async def flush_digest(self):
+        """Sends the buffered DMs to the owner as a few combined embeds."""
+        if self._digest_handle is not None:
+            self._digest_handle.cancel()
+            self._digest_handle = None
+        if not self._digest:
+            return
+
+        entries, dropped = self._digest, self._digest_dropped
+        self._digest, self._digest_dropped = [], 0
+        owner = await self.get_owner()
+        for e in self.build_digest(entries, dropped):
+            await self.bot.send_message(owner, embed=e)
+
     @commands.command(name='dms', hidden=True)
     @checks.is_owner()
     async def _senddms(self):
@@ -106,6 +218,20 @@ class BotAdmin:
         await self.bot.config.put('meta', data)
         await self.bot.responses.toggle(message="Forwarding of DMs to owner has been {status}.", success=data['send_dms'])
 
+    @commands.command(name='dmdigest', hidden=True)
+    @checks.is_owner()
+    async def _dmdigest(self, seconds: int = 0):
+        """Collects forwarded DMs into a digest sent every so many seconds.
+
+        Use 0 to forward every DM as soon as it arrives.
+        """
+        data = self.bot.config.get("meta", {})
+        data['dm_digest'] = max(seconds, 0)
+        await self.bot.config.put('meta', data)
+        if not seconds:
+            await self.flush_digest()
+        await self.bot.responses.toggle(message="Digests of forwarded DMs have been {status}.", success=seconds > 0)
+
     @commands.command(name='quit', hidden=True)
     @checks.is_owner()
     async def _quit(self):
@@ -134,7 +260,7 @@ class BotAdmin:
         """Sets the default color of embeds."""
         sections = [{"name": "Section 1", "value": "Value 1"}, {"name": "Section 2"}, {"name": "Section 2.5", "value": "Value 2.5"},
                     {"name": "Section 3", "value": "Value 3", "inline": False}]
-        e = discordbot.embeds.build_embed(title="IDK", description="foo bar", sections=sections)
+        e = build_embed(title="IDK", description="foo bar", sections=sections)
         await self.bot.say(embed=e)
 
     @discordbot.command(name="do", pass_context=True, hidden=True)
@@ -167,7 +293,7 @@ class BotAdmin:
         entries = cmds.get(guild_id, [])
         entries.append(command)
         cmds[guild_id] = entries
-        await self.config.put('commands', cmds)
+        await self.config.put('commands', cmds, changed=(guild_id,))
         await self.bot.responses.success(message='"%s" command disabled in this server.' % command)
 
     @commands.command(pass_context=True, no_pm=True)
@@ -189,9 +315,42 @@ class BotAdmin:
             await self.bot.responses.failure(message='The command does not exist or is not disabled.')
         else:
             cmds[guild_id] = entries
-            await self.config.put('commands', cmds)
+            await self.config.put('commands', cmds, changed=(guild_id,))
             await self.bot.responses.success(message='"%s" command enabled in this server.' % command)
 
+    @commands.group(pass_context=True, invoke_without_command=True)
+    async def prefix(self, ctx):
+        """Shows the command prefixes used in this server."""
+        prefixes = self.bot.prefixes.prefixes(ctx.message)
+        await self.bot.responses.basic(title="Prefixes:", message=', '.join('`{}`'.format(p) for p in prefixes))
+
+    @prefix.command(name='set', pass_context=True, no_pm=True)
+    @checks.admin_or_permissions(manage_server=True)
+    async def prefix_set(self, ctx, *prefixes: str):
+        """Sets the command prefixes for this server.
+
+        Multiple prefixes can be given, separated by spaces.
+
+        You must have Manage Server permissions or the
+        Bot Admin role to use this command.
+        """
+        if not prefixes:
+            return await self.bot.responses.failure(message='You need to give at least one prefix.')
+
+        await self.bot.prefixes.set(ctx.message.server.id, prefixes)
+        await self.bot.responses.success(message='Prefixes set to {}.'.format(', '.join('`{}`'.format(p) for p in prefixes)))
+
+    @prefix.command(name='reset', pass_context=True, no_pm=True)
+    @checks.admin_or_permissions(manage_server=True)
+    async def prefix_reset(self, ctx):
+        """Makes this server use the default prefixes again.
+
+        You must have Manage Server permissions or the
+        Bot Admin role to use this command.
+        """
+        await self.bot.prefixes.reset(ctx.message.server.id)
+        await self.bot.responses.success(message='Prefixes reset to the default.')
+
     @commands.group(pass_context=True, no_pm=True)
     @checks.admin_or_permissions(manage_channels=True)
     async def ignore(self, ctx):
@@ -310,7 +469,8 @@ class BotAdmin:
 
         If a search number is specified, it searches that many messages to delete.
         If the bot has Manage Messages permissions, then it will try to delete
-        messages that look like they invoked the bot as well.
+        messages that look like they invoked the bot as well, in bulk where
+        Discord allows it. Long cleanups report their progress as they go.
 
         After the cleanup is completed, the bot will send you a message with
         which people got their messages deleted and their count. This is useful
@@ -320,44 +480,34 @@ class BotAdmin:
         Bot Mod role.
         """
 
-        spammers = Counter()
         channel = ctx.message.channel
-        prefixes = self.bot.command_prefix
-        if callable(prefixes):
-            prefixes = prefixes(self.bot, ctx.message)
+        match_prefix = self.bot.prefixes.match
 
         def is_possible_command_invoke(entry):
-            valid_call = any(entry.content.startswith(prefix) for prefix in prefixes)
-            return valid_call and not entry.content[1:2].isspace()
+            prefix = match_prefix(entry)
+            return prefix is not None and not entry.content[len(prefix):len(prefix) + 1].isspace()
 
         can_delete = channel.permissions_for(channel.server.me).manage_messages
+        deleter = MessageDeleter(self.bot, channel, bulk=can_delete)
+        status = None
+
+        async def report(deleter):
+            nonlocal status
+            e = build_embed(title="Cleaning up...", color=Colors.get_default(self.bot),
+                            description='Searched {0.scanned} messages and removed {0.total} '
+                                        '({0.throughput:.1f}/s).'.format(deleter))
+            if status is None:
+                status = await self.bot.send_message(channel, embed=e)
+            else:
+                await self.bot.edit_message(status, embed=e)
 
-        if not can_delete:
-            api_calls = 0
-            async for entry in self.bot.logs_from(channel, limit=search, before=ctx.message):
-                if api_calls and api_calls % 5 == 0:
-                    await asyncio.sleep(1.1)
-
-                if entry.author == self.bot.user:
-                    await self.bot.delete_message(entry)
-                    spammers['Bot'] += 1
-                    api_calls += 1
-
-                if is_possible_command_invoke(entry):
-                    try:
-                        await self.bot.delete_message(entry)
-                    except discord.Forbidden:
-                        continue
-                    else:
-                        spammers[entry.author.display_name] += 1
-                        api_calls += 1
-        else:
-            predicate = lambda m: m.author == self.bot.user or is_possible_command_invoke(m)
-            deleted = await self.bot.purge_from(channel, limit=search, before=ctx.message, check=predicate)
-            spammers = Counter(m.author.display_name for m in deleted)
+        predicate = lambda m: m.author == self.bot.user or is_possible_command_invoke(m)
+        spammers = await deleter.run(search, before=ctx.message, check=predicate, progress=report)
+        if status is not None:
+            await self.bot.delete_message(status)
 
-        deleted = sum(spammers.values())
-        messages = ['%s %s removed.' % (deleted, 'message was' if deleted == 1 else 'messages were')]
+        deleted = deleter.total
+        messages = ['%s %s removed in %.1fs.' % (deleted, 'message was' if deleted == 1 else 'messages were', deleter.elapsed)]
         if deleted:
             messages.append('')
             spammers = sorted(spammers.items(), key=lambda t: t[1], reverse=True)
@@ -390,7 +540,7 @@ class BotAdmin:
 
         db.append(member.id)
         plonks[guild_id] = db
-        await self.config.put('plonks', plonks)
+        await self.config.put('plonks', plonks, changed=(guild_id,))
         await self.bot.responses.success(message='%s has been banned from using the bot in this server.' % member)
 
     @commands.command(no_pm=True, pass_context=True)
@@ -425,7 +575,7 @@ class BotAdmin:
             await self.bot.responses.failure(message='%s is not banned from using the bot in this server.' % member)
         else:
             plonks[guild_id] = db
-            await self.config.put('plonks', plonks)
+            await self.config.put('plonks', plonks, changed=(guild_id,))
             await self.bot.responses.success(message='%s has been unbanned from using the bot in this server.' % member)
 
 def setup(bot):
@@ -1,15 +1,17 @@
 import copy, os, json
+import asyncio
 import datetime
+import heapq
 import traceback
-from collections import Counter
-from collections import OrderedDict
+from collections import Counter, defaultdict
 
 import discord
 import psutil, aiohttp
 from discord.ext import commands
 
-from ..bot_utils import config, checks
+from ..bot_utils import checks
 from ..bot_utils.paginator import Pages
+from ..bot_utils.usage import UsageHistory, longest_window, parse_window
 from ..colors import Colors
 
 
@@ -17,6 +19,12 @@ CARBONITEX_API = "https://www.carbonitex.net/discord/data/botdata.php"
 DISCORDBOTS_PW = "https://bots.discord.pw/api"
 DISCORDBOTS_ORG = "https://discordbots.org/api"
 
+# how often command counts are written back to stats.json, in seconds
+STATS_FLUSH_INTERVAL = 60
+
+# usage.json key of the history of every command run anywhere
+ALL_USAGE = 'all'
+
 
 class Meta:
     """Commands for utilities related to Discord or the Bot itself."""
@@ -24,9 +32,101 @@ class Meta:
     def __init__(self, bot):
         self.bot = bot
         self.process = psutil.Process()
-        self.config = config.Config('stats.json', loop=bot.loop, directory="data")
+        self.config = bot.open_config('stats.json')
         self.session = aiohttp.ClientSession(loop=bot.loop)
 
+        # server or user id: Counter(command name) of uses not yet written to the store
+        self._pending = defaultdict(Counter)
+        # Counter(command name) over every server and user and the sum of it, built from
+        # stats.json on first use and kept up to date as commands run
+        self._totals = None
+        self._total = 0
+        # config generation the totals were counted from, a reload or merge makes them stale
+        self._totals_generation = None
+        # server or user id (or ALL_USAGE): UsageHistory, loaded from usage.json on first use
+        self.usage = bot.open_config('usage.json', write_delay=10.0)
+        self._history = {}
+        self._history_dirty = set()
+        self._stats_task = bot.loop.create_task(self._flush_stats_periodically())
+
+    def __unload(self):
+        self._stats_task.cancel()
+        self.bot.loop.create_task(self.flush_stats())
+
+    async def on_shutdown(self):
+        await self.flush_stats()
+
+    async def flush_stats(self):
+        """Adds the pending command counts to the stored ones and saves changed histories."""
+        dirty, self._history_dirty = self._history_dirty, set()
+        for id in dirty:
+            await self.usage.put(id, self._history[id].to_json())
+
+        if not self._pending:
+            return
+
+        await self.config.wait_until_ready()
+        pending, self._pending = self._pending, defaultdict(Counter)
+        data = self.config.get('data', {})
+        for id, counts in pending.items():
+            server_data = data.setdefault(id, {})
+            for name, count in counts.items():
+                server_data[name] = server_data.get(name, 0) + count
+        await self.config.put('data', data)
+
+    def history(self, id=ALL_USAGE):
+        """Returns the :class:`UsageHistory` of a server or user id, or of the whole bot."""
+        try:
+            return self._history[id]
+        except KeyError:
+            stored = self.usage.get(id)
+            history = self._history[id] = UsageHistory.from_json(stored) if stored else UsageHistory()
+            return history
+
+    async def _flush_stats_periodically(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            await self.flush_stats()
+
+    async def command_counts(self, id=None):
+        """Returns how often each command was used, including uses not written out yet.
+
+        Counts are for one server or user id, or for everything when no id is given.
+        The counts for everything are live and must not be modified.
+        """
+        await self.config.wait_until_ready()
+        if id is None:
+            return self._global_totals()
+
+        counts = Counter(self.config.get('data', {}).get(id, {}))
+        counts.update(self._pending.get(id, {}))
+        return counts
+
+    def _global_totals(self):
+        if self._totals is None or self._totals_generation != self.config.generation:
+            self._totals_generation = self.config.generation
+            totals = Counter()
+            for server_data in self.config.get('data', {}).values():
+                totals.update(server_data)
+            for pending in self._pending.values():
+                totals.update(pending)
+            self._totals = totals
+            self._total = sum(totals.values())
+        return self._totals
+
+    async def total_commands(self):
+        """Returns how many commands were run in total."""
+        await self.config.wait_until_ready()
+        self._global_totals()
+        return self._total
+
+    async def top_commands(self, count=None, id=None):
+        """Returns (command name, uses) pairs of the most used commands, most used first."""
+        counts = await self.command_counts(id)
+        if count is None:
+            return sorted(counts.items(), key=lambda x: x[1], reverse=True)
+        return heapq.nlargest(count, counts.items(), key=lambda x: x[1])
+
     @commands.command(pass_context=True, aliases=['invite'])
     async def join(self, ctx):
         """Sends you the bot invite link."""
@@ -53,7 +153,7 @@ class Meta:
 
         e = discord.Embed()
         roles = [role.name.replace('@', '@\u200b') for role in member.roles]
-        shared = sum(1 for m in self.bot.get_all_members() if m.id == member.id)
+        shared = self.bot.shared_server_count(member.id)
         voice = member.voice_channel
         if voice is not None:
             other_people = len(voice.voice_members) - 1
@@ -137,32 +237,49 @@ class Meta:
 
         self.bot.logs['stats'].info('{0.timestamp}: {0.author.name} in {1}: {0.content}'.format(message, destination))
 
-        data = self.config.get('data', {})
-        server_data = data.get(id, {})
-        server_data[ctx.command.qualified_name] = server_data.get(ctx.command.qualified_name, 0) + 1
-        data[id] = server_data
-        await self.config.put('data', data)
+        name = ctx.command.qualified_name
+        self._pending[id][name] += 1
+        if self._totals is not None:
+            self._totals[name] += 1
+            self._total += 1
+
+        await self.usage.wait_until_ready()
+        for scope in (id, ALL_USAGE):
+            self.history(scope).record(name)
+            self._history_dirty.add(scope)
 
     @commands.command(pass_context=True, hidden=True)
     @checks.is_owner()
-    async def commandstats(self, ctx, all_stats : bool=False):
-        data = self.config.get('data', {})
+    async def commandstats(self, ctx, *options : str):
+        """Shows how often commands were used.
+
+        Pass "all" for the whole bot instead of this server and a time
+        window like 24h, 7d or "last 30m" to only count recent uses.
+        """
+        options = [option.lower() for option in options]
+        all_stats = bool(options) and options[0] in ('all', 'true', 'yes', '1')
         if all_stats:
-            title = "Bot"
-            commands = {}
-            for d in data:
-                server_cmds = data.get(d, {})
-                for c in server_cmds.keys():
-                    current = commands.get(c, 0)
-                    commands[c] = current + server_cmds[c]
+            options = options[1:]
+        if options and options[0] == 'last':
+            options = options[1:]
+
+        window = None
+        if options:
+            window = parse_window(''.join(options))
+            if window is None:
+                return await self.bot.responses.failure(message='"{}" is not a time window like 24h or 7d.'.format(' '.join(options)))
+            window = min(window, longest_window())
+
+        id = None if all_stats else ctx.message.server.id
+        title = "Bot" if all_stats else "This Server"
+        if window is None:
+            commands = await self.top_commands(id=id)
         else:
-            title = "This Server"
-            commands = data.get(ctx.message.server.id, {})
-        commands = OrderedDict(sorted(commands.items(), key=lambda x: x[1], reverse=True))
+            await self.usage.wait_until_ready()
+            commands = self.history(ALL_USAGE if id is None else id).counts(window).most_common()
+            title += " (last {})".format(''.join(options))
 
-        stats = []
-        for c in commands.keys():
-            stats.append(c + ": " + str(commands[c]))
+        stats = ['{}: {}'.format(name, uses) for name, uses in commands]
         try:
             pager = Pages(self.bot, message=ctx.message, entries=stats)
             pager.embed.colour = Colors.get_default(self.bot)
@@ -228,15 +345,11 @@ class Meta:
         embed.set_author(name="Created by "+str(owner), icon_url=owner.avatar_url)
 
         # statistics
-        total_members = sum(len(s.members) for s in self.bot.servers)
-        total_online  = sum(1 for m in self.bot.get_all_members() if m.status != discord.Status.offline)
-        unique_members = set(self.bot.get_all_members())
-        unique_online = sum(1 for m in unique_members if m.status != discord.Status.offline)
-        channel_types = Counter(c.type for c in self.bot.get_all_channels())
-        voice = channel_types[discord.ChannelType.voice]
-        text = channel_types[discord.ChannelType.text]
-
-        members = '%s total\n%s online\n%s unique\n%s unique online' % (total_members, total_online, len(unique_members), unique_online)
+        population = self.bot.population
+        voice = population.channel_types[discord.ChannelType.voice]
+        text = population.channel_types[discord.ChannelType.text]
+
+        members = '%s total\n%s online\n%s unique\n%s unique online' % (population.total, population.online, population.unique, population.unique_online)
         embed.add_field(name='Members', value=members)
         embed.add_field(name='Channels', value='{} total\n{} text\n{} voice'.format(text + voice, text, voice))
         memory_usage = self.process.memory_full_info().uss / 1024**2
@@ -245,13 +358,13 @@ class Meta:
         embed.set_footer(text='Made with discord.py & discordbot.py', icon_url='http://i.imgur.com/5BFecvA.png')
         embed.timestamp = self.bot.uptime
 
-        data = self.config.get('data', {})
-        summation = 0
-        for server in data:
-            summation += sum(data[server].values())
+        summation = await self.total_commands()
+        most_used = ', '.join('{} ({})'.format(name, uses) for name, uses in await self.top_commands(3))
 
         embed.add_field(name='Servers', value=str(len(self.bot.servers)))
         embed.add_field(name='Commands Run', value=summation)
+        if most_used:
+            embed.add_field(name='Most Used', value=most_used)
         embed.add_field(name='Uptime', value=self.get_bot_uptime(brief=True))
 
         await self.bot.say(embed=embed)
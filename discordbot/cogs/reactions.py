@@ -1,51 +1,96 @@
+import asyncio
+from collections import Counter, OrderedDict, defaultdict
+
 from discord.ext import commands
 
-from ..bot_utils import config, checks
+from ..bot_utils import checks
+from ..bot_utils.dispatch import ReactionDispatcher
+from ..bot_utils.matcher import TriggerMatcher
 from ..bot_utils.paginator import Pages
 
 
+# how often trigger hit counts are written back to the reactions store, in seconds
+STATS_FLUSH_INTERVAL = 300
+
+# how many guilds keep their matchers in memory, and their triggers with the sharded or binary backend
+MAX_MATCHERS = 1000
+
+
 class Reactions:
     """React to different phrases with a response and emoji reactions."""
 
     def __init__(self, bot):
         self.bot = bot
-        self.config = config.Config('reactions.json', loop=bot.loop, directory="data")
-
-    async def on_message(self, message):
-        if message.author.bot:
+        self.config = bot.open_config('reactions.json', max_loaded=MAX_MATCHERS)
+
+        # guild_id: (config generation, trigger count, TriggerMatcher), least recently used first
+        self._matchers = OrderedDict()
+        self.dispatcher = ReactionDispatcher(bot)
+
+        # guild_id: Counter(trigger) of hits not yet written to the store
+        self._hits = defaultdict(Counter)
+        self._stats_task = bot.loop.create_task(self._flush_stats_periodically())
+        bot.add_message_stage(self.react)
+
+    def __unload(self):
+        self.bot.remove_message_stage(self.react)
+        self._stats_task.cancel()
+        self.bot.loop.create_task(self.flush_stats())
+
+    async def on_shutdown(self):
+        await self.flush_stats()
+
+    def get_matcher(self, guild_id, reactions):
+        # the reaction commands drop the entry when they change triggers, a reload
+        # of the store bumps its generation. An evicted shard comes back unchanged
+        cached = self._matchers.get(guild_id)
+        if cached is None or cached[0] != self.config.generation or cached[1] != len(reactions):
+            cached = (self.config.generation, len(reactions), TriggerMatcher(reactions.keys()))
+            self._matchers[guild_id] = cached
+            if len(self._matchers) > MAX_MATCHERS:
+                self._matchers.popitem(last=False)
+        self._matchers.move_to_end(guild_id)
+        return cached[2]
+
+    async def flush_stats(self):
+        """Adds the pending trigger hit counts to the stored reactions."""
+        pending, self._hits = self._hits, defaultdict(Counter)
+        for guild_id, hits in pending.items():
+            data = self.config.get(guild_id, {})
+            for trigger, count in hits.items():
+                if trigger in data:
+                    data[trigger]["hits"] = data[trigger].get("hits", 0) + count
+            await self.config.put(guild_id, data)
+
+    async def _flush_stats_periodically(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            await self.flush_stats()
+
+    async def react(self, ctx):
+        if ctx.is_private or ctx.ignored or ctx.has_prefix:
             return
 
-        if message.channel.is_private:
-            return
+        await self.config.wait_until_ready()
+        await self._check_for_reactions(ctx.message, ctx.content_lower)
 
-        if message.channel.id in self.bot.get_cog("BotAdmin").config.get('ignored', []):
+    async def _check_for_reactions(self, message, content):
+        reactions = self.config.get(message.server.id, {})
+        if not reactions:
             return
 
-        if not message.content.startswith(self.bot.command_prefix):
-            await self._check_for_reactions(message)
-
-    async def _check_for_reactions(self, message):
-        reactions = self.config.get(message.server.id, {})
-        activated = [s for s in message.content.lower().split() if s in reactions.keys()]
-        activated = []
-        msg = message.content.lower()
-        for r in reactions.keys():
-            location = msg.find(r.lower())
-            if location >= 0:
-                if location + len(r) >= len(msg):
-                    activated.append(r)
-                elif msg[location + len(r)] in [' ', '.', '!', '?', ',', "'"]:
-                    activated.append(r)
+        activated = self.get_matcher(message.server.id, reactions).match(content)
         if activated:
+            self._hits[message.server.id].update(activated)
+            responses = []
+            reacts = []
             for reaction in activated:
                 response = reactions.get(reaction, {}).get("response", "")
-                reacts = reactions.get(reaction, {}).get("reaction", [])
                 if response:
-                    await self.bot.send_message(message.channel, response)
+                    responses.append(response)
+                reacts.extend(reactions.get(reaction, {}).get("reaction", []))
 
-                if reacts:
-                    for r in reacts:
-                        await self.bot.add_reaction(message, r)
+            await self.dispatcher.dispatch(message, responses=responses, reactions=reacts)
 
     @commands.command(pass_context=True, no_pm=True, aliases=["acr"])
     @checks.mod_or_permissions(manage_messages=True)
@@ -77,15 +122,17 @@ class Reactions:
         msg = await self.bot.say("Awesome! Now react to this message any reactions I should have to '{}'. (React \U000023f9 to stop)".format(reactor))
         await self.bot.wait_for_reaction(message=msg, check=check)
 
-        for i, reaction in enumerate(reactions):
-            reaction = reaction if isinstance(reaction, str) else reaction.name + ":" + str(reaction.id)
+        reactions = [r if isinstance(r, str) else r.name + ":" + str(r.id) for r in reactions]
+        # one at a time and unguarded, unlike the dispatcher: an emoji the bot can't use aborts the command here
+        # instead of being saved and failing quietly on every match
+        for reaction in reactions:
             await self.bot.add_reaction(ctx.message, reaction)
-            reactions[i] = reaction
 
         if response:
             keyword["response"] = response.content if response.content.lower() != "$none" else ""
         keyword["reaction"] = reactions
         data[reactor] = keyword
+        self._matchers.pop(ctx.message.server.id, None)
         await self.config.put(ctx.message.server.id, data)
 
         await self.bot.responses.success(message="Reaction '{}' has been added.".format(reactor))
@@ -107,6 +154,27 @@ class Reactions:
         except Exception as e:
             await self.bot.say(e)
 
+    @commands.command(pass_context=True, no_pm=True, aliases=["scr"])
+    @checks.mod_or_permissions(manage_messages=True)
+    async def reactionstats(self, ctx, count : int = 50):
+        """Shows the server's most used reactions"""
+        guild_id = ctx.message.server.id
+        data = self.config.get(guild_id, {})
+        pending = self._hits.get(guild_id, {})
+        hits = Counter({trigger: keyword.get("hits", 0) + pending.get(trigger, 0) for trigger, keyword in data.items()})
+        top = [(trigger, uses) for trigger, uses in hits.most_common(count) if uses]
+        if not top:
+            await self.bot.responses.failure(message="None of the reactions on this server have been used yet.")
+            return
+        try:
+            pager = Pages(self.bot, message=ctx.message, entries=['{}: {}'.format(*t) for t in top])
+            pager.embed.colour = 0x738bd7  # blurple
+            pager.embed.set_author(name=ctx.message.server.name + " Reaction Stats", icon_url=ctx.message.server.icon_url)
+            await pager.paginate()
+
+        except Exception as e:
+            await self.bot.say(e)
+
     @commands.command(pass_context=True, no_pm=True, aliases=["vcr"])
     @checks.mod_or_permissions(manage_messages=True)
     async def viewreaction(self, ctx, *, reactor : str):
@@ -144,6 +212,7 @@ class Reactions:
         keyword = data.get(reactor, {})
         if keyword:
             data.pop(reactor)
+            self._matchers.pop(ctx.message.server.id, None)
             await self.config.put(ctx.message.server.id, data)
             await self.bot.responses.success(message="Reaction '{}' has been deleted.".format(reactor))
         else:
@@ -155,6 +224,7 @@ class Reactions:
         """Removes a reaction"""
         data = self.config.get(ctx.message.server.id, {})
         if data:
+            self._matchers.pop(ctx.message.server.id, None)
             await self.config.put(ctx.message.server.id, {})
             await self.bot.responses.success(message="All reactions have been deleted.")
         else:
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import sys
@@ -7,8 +8,11 @@ from discord.ext import commands
 from discord.ext.commands.bot import _mention_pattern, _mentions_transforms
 
 from . import colors, embeds
-from .bot_utils import config
+from .bot_utils import checks, config
+from .bot_utils.population import PopulationTracker
+from .bot_utils.prefixes import PrefixResolver
 from .messages import Messages
+from .pipeline import MessageContext
 import traceback, datetime
 
 
@@ -66,7 +70,7 @@ async def _default_help_command(ctx, *commands : str):
 class DiscordBot(commands.Bot):
 
     def __init__(self, command_prefix=None, formatter=None, description=None, pm_help=None, **options):
-        self.config = config.Config('settings.json', directory="")
+        self.config = config.open_config('settings.json', directory="")
 
         if command_prefix is None:
             command_prefix = self.config.get("meta", {}).get("prefix", "")
@@ -119,9 +123,79 @@ class DiscordBot(commands.Bot):
         self.remove_command("help")
         self.command(**self.help_attrs)(_default_help_command)
 
+        # (priority, coroutine function) for every message stage, lowest first
+        self._message_stages = []
+        # a listener rather than on_message, so bots that replace on_message with @bot.event keep the stages
+        self.add_listener(self.start_message_stages, 'on_message')
+
+        # per server prefixes on top of the default one, everything resolves prefixes through this
+        self.prefixes = PrefixResolver(self, command_prefix, self.open_config('prefixes.json'))
+        self.command_prefix = self.prefixes
+
+        checks.permissions.install(self)
+
+        # member and channel counts for the whole bot, kept up to date from events
+        self.population = PopulationTracker(self)
+        self.population.install()
+
+    def open_config(self, name, **options):
+        """Opens a data file with the storage backend picked in settings.json.
+
+        ``meta.storage`` overrides the ``backend`` the caller asks for, so
+        cogs can be moved to another backend by configuration alone.
+        """
+        options.setdefault('loop', self.loop)
+        options.setdefault('directory', "data")
+        # before login everything is loaded together in start()
+        options.setdefault('load_later', not self.is_logged_in)
+        backend = self.config.get("meta", {}).get("storage")
+        if backend:
+            options['backend'] = backend
+        return config.open_config(name, **options)
+
+    def add_message_stage(self, stage, priority=100):
+        """Registers a coroutine that runs for every message not sent by a bot.
+
+        Stages are called with a shared :class:`MessageContext` in ascending
+        ``priority``, so early stages can fill in facts for later ones. A stage
+        returning ``True`` stops the stages after it. Commands are processed
+        independently of the stages.
+        """
+        self._message_stages.append((priority, stage))
+        self._message_stages.sort(key=lambda s: s[0])
+
+    def remove_message_stage(self, stage):
+        self._message_stages = [s for s in self._message_stages if s[1] != stage]
+
+    def shared_servers(self, user_id):
+        """Returns the servers the bot shares with a user."""
+        servers = map(self.get_server, self.population.server_ids(user_id))
+        return [server for server in servers if server is not None]
+
+    def shared_server_count(self, user_id):
+        """Returns how many servers the bot shares with a user."""
+        return self.population.server_count(user_id)
+
+    async def start_message_stages(self, message):
+        if message.author.bot or not self._message_stages:
+            return
+
+        ctx = MessageContext(message, self.prefixes.match(message))
+        # a slow stage shouldn't hold up commands
+        self.loop.create_task(self.run_message_stages(ctx))
+
+    async def run_message_stages(self, ctx):
+        for _, stage in list(self._message_stages):
+            try:
+                if await stage(ctx):
+                    break
+            except Exception:
+                print('In message stage {}:'.format(getattr(stage, '__qualname__', stage)), file=sys.stderr)
+                traceback.print_exc()
+
     async def set_prefix(self, prefix):
-        self.command_prefix = prefix
-        await self.change_presence(game=discord.Game(name='{}help for help'.format(prefix)))
+        self.prefixes.set_default(prefix)
+        await self.change_presence(game=discord.Game(name='{}help for help'.format(self.prefixes.default_prefix)))
 
     def load_cogs(self, cogs = None):
         if cogs is None:
@@ -136,6 +210,19 @@ class DiscordBot(commands.Bot):
     def run(self):
         super().run(self.token)
 
+    async def start(self, *args, **kwargs):
+        await self.load_configs()
+        self.loop.create_task(config.watch(log=self.logs['info']))
+        recount = self.config.get("meta", {}).get("population_recount", 0)
+        if recount:
+            self.loop.create_task(self.population.recount_periodically(recount))
+        await super().start(*args, **kwargs)
+
+    async def load_configs(self):
+        """Loads every pending data file concurrently and logs how long each took."""
+        for path, seconds in await config.load_pending():
+            self.logs['info'].info('Loaded {} in {:.1f}ms'.format(path, seconds * 1000))
+
     async def on_command_error(self, error, ctx):
         if isinstance(error, commands.NoPrivateMessage):
             await self.send_message(ctx.message.author, 'This command cannot be used in private messages.')
@@ -151,7 +238,7 @@ class DiscordBot(commands.Bot):
         print('Username: ' + self.user.name)
         print('ID: ' + self.user.id)
         print('------')
-        await self.change_presence(game=discord.Game(name='{}help for help'.format(self.command_prefix)))
+        await self.change_presence(game=discord.Game(name='{}help for help'.format(self.prefixes.default_prefix)))
         if not hasattr(self, 'uptime'):
             self.uptime = datetime.datetime.utcnow()
 
@@ -165,6 +252,10 @@ class DiscordBot(commands.Bot):
         print('resumed...')
 
     async def logout(self):
+        # cogs get to write out whatever they keep in memory first,
+        # then make sure write-behind configs hit the disk before we go away
+        await asyncio.gather(*(listener() for listener in self.extra_events.get('on_shutdown', [])))
+        await config.flush_all()
         await super(DiscordBot, self).logout()
         for log in self.logs.values():
             for h in log.handlers:
@@ -0,0 +1,39 @@
+class MessageContext:
+    """Facts about an incoming message, worked out once and shared by every
+    message stage registered with :meth:`DiscordBot.add_message_stage`.
+
+    Attributes
+    -----------
+    message: discord.Message
+        The message itself.
+    is_bot: bool
+        Whether the author is a bot.
+    is_private: bool
+        Whether the message was sent in a private channel.
+    prefix: Optional[str]
+        The command prefix the message starts with, if any.
+    ignored: bool
+        Whether the channel is on the ignore list. Set by an early stage,
+        BotAdmin's when it is loaded.
+    """
+
+    __slots__ = ('message', 'is_bot', 'is_private', 'prefix', 'ignored', '_content_lower')
+
+    def __init__(self, message, prefix=None):
+        self.message = message
+        self.is_bot = message.author.bot
+        self.is_private = message.channel.is_private
+        self.prefix = prefix
+        self.ignored = False
+        self._content_lower = None
+
+    @property
+    def has_prefix(self):
+        return self.prefix is not None
+
+    @property
+    def content_lower(self):
+        """The message content in lower case, computed on first use."""
+        if self._content_lower is None:
+            self._content_lower = self.message.content.lower()
+        return self._content_lower